@@ -0,0 +1,177 @@
+import io
+import os
+import sys
+import json
+import pathlib
+import tempfile
+import contextlib
+from argparse import ArgumentParser
+
+# the parsers live in their own folders next to this one
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+for tool_directory in ["parsing_tools", "segb_parser", "plist_parser", "iMessageQuery", "knowledgeC"]:
+    sys.path.append(str(REPO_ROOT / tool_directory))
+from archive_reader import HEADER_SIZE, iter_archive, identify_artifact, member_buffer, spool_member, safe_member_path
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
+from xml_plist import is_xml_plist, read_xml_plist
+
+__description__ = "Parses the artifacts inside a tar or zip triage archive in one pass, without extracting it"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# SQLite databases are recognised by name, they need a real file so they are spooled to disk
+DATABASE_TOOLS = {
+    "chat.db": "imessage",
+    "sms.db": "imessage",
+    "knowledgec.db": "knowledgec",
+}
+# journal files are spooled next to their database so SQLite applies them
+SQLITE_SIDECARS = ("-wal", "-shm", "-journal")
+# XML only names its root element after the declaration and doctype, this much is read to find <plist
+XML_HEADER_SIZE = 1024
+
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description="A tool to parse the artifacts inside a tar or zip archive without extracting it")
+    parser.add_argument("-a", "--archive", dest="archive_path", required=True, help="Path to the tar (.tar, .tar.gz, ...) or zip archive")
+    parser.add_argument("-o", "--output-dir", dest="output_dir", required=True, help="Directory for the outputs and manifest.json")
+    parser.add_argument("-p", "--protobuf", dest="decode_protobuf", action="store_true", help="Decode SEGB record data as protobuf")
+    parser.add_argument("--format", dest="output_format", choices=["json", "ndjson"], default="json", help="SEGB output format (default: json)")
+    parser.add_argument("-l", "--list", dest="list_only", action="store_true", help="Only list the recognised members with their offsets")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def database_tool(member_name):
+    return DATABASE_TOOLS.get(os.path.basename(member_name).lower())
+
+
+def is_database_sidecar(member_name):
+    name = os.path.basename(member_name).lower()
+    return any(name.endswith(suffix) and name[:-len(suffix)] in DATABASE_TOOLS for suffix in SQLITE_SIDECARS)
+
+
+def write_segb(buffer, member, output_base, decode_protobuf, output_format, metrics):
+    from segb_parser import RecordWriter, iter_segb_buffer_entries, output_suffix
+    output_file = output_base + "_output" + output_suffix(output_format)
+    with RecordWriter(output_file, output_format) as writer:
+        for _, entry in iter_segb_buffer_entries(buffer, member.name, decode_protobuf, metrics=metrics):
+            with metrics.stage("write"):
+                writer.write(entry)
+    return [output_file]
+
+
+def write_cookies(buffer, member, output_base, metrics):
+    from bcf_parser import Cookies
+    # Cookies replaces the suffix of the name it is given, so it gets the final one
+    output_file = output_base + "_output.json"
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        Cookies(member.name, output_file, "json", metrics=metrics, data=buffer)
+    return [output_file]
+
+
+def write_plist(buffer, output_base, metrics):
+    from plist_parser import parse_plist, custom_pretty_print
+    output_file = output_base + "_output.txt"
+    with metrics.stage("parse"):
+        data = bytes(buffer)
+        parsed_data = parse_plist(read_xml_plist(io.BytesIO(data)) if is_xml_plist(data[:HEADER_SIZE]) else data)
+    with metrics.stage("write"), open(output_file, "w") as f, contextlib.redirect_stdout(f):
+        custom_pretty_print(parsed_data)
+        print()
+    return [output_file]
+
+
+def query_database(tool, database_path, output_base, metrics):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if tool == "imessage":
+            from iMessageQuery import run_sqlite_query
+            output_file = output_base + "_output.json"
+            run_sqlite_query(database_path, output_file, metrics=metrics)
+            return [output_file]
+        from knowledgeC import run_sqlite_query
+        output_directory = output_base + "_output"
+        os.makedirs(output_directory, exist_ok=True)
+        run_sqlite_query(database_path, output_directory, metrics=metrics)
+    return sorted(str(path) for path in pathlib.Path(output_directory).glob("output_*.json"))
+
+
+def triage_archive(archive_path, output_dir, decode_protobuf=False, output_format="json", list_only=False,
+                   metrics=NO_METRICS):
+    """
+    Reads an archive once, front to back, and parses every SEGB, binarycookies
+    and binary or XML plist member straight from memory (large members are spooled
+    to a temporary file and memory-mapped). chat.db, sms.db and knowledgeC.db
+    are copied to a temporary directory with their -wal/-shm files and
+    queried once the pass is done. Returns the manifest: one entry per
+    recognised member with its offset, size, type, outputs and any error.
+    """
+    manifest = []
+    databases = []
+    with tempfile.TemporaryDirectory(prefix="archive_triage_") as spool_directory:
+        for member, fileobj in metrics.timed_iter("archive", iter_archive(archive_path), counter="members"):
+            header = fileobj.read(HEADER_SIZE)
+            tool = database_tool(member.name)
+            artifact_type = tool if tool else identify_artifact(header)
+            if artifact_type is None and is_xml_plist(header):
+                header += fileobj.read(XML_HEADER_SIZE - len(header))
+                if b"<plist" in header:
+                    artifact_type = "plist"
+            if is_database_sidecar(member.name):
+                artifact_type = "sqlite sidecar"
+            if artifact_type is None or artifact_type == "sqlite":
+                continue
+
+            entry = {"member": member.name, "offset": member.offset, "size": member.size, "type": artifact_type}
+            manifest.append(entry)
+            if list_only:
+                continue
+            relative_path = safe_member_path(member.name)
+            output_base = os.path.join(output_dir, relative_path)
+            os.makedirs(os.path.dirname(output_base), exist_ok=True)
+            metrics.count("archive", bytes=member.size)
+            try:
+                if tool or artifact_type == "sqlite sidecar":
+                    with metrics.stage("spool"):
+                        spooled_path = spool_member(fileobj, os.path.join(spool_directory, relative_path), header)
+                    if tool:
+                        databases.append((entry, tool, spooled_path, output_base))
+                    continue
+                with member_buffer(fileobj, member.size, header) as buffer:
+                    if artifact_type == "segb":
+                        entry["outputs"] = write_segb(buffer, member, output_base, decode_protobuf, output_format, metrics)
+                    elif artifact_type == "cookies":
+                        entry["outputs"] = write_cookies(buffer, member, output_base, metrics)
+                    elif artifact_type == "plist":
+                        entry["outputs"] = write_plist(buffer, output_base, metrics)
+            except Exception as e:
+                entry["error"] = f"{type(e).__name__}: {e}"
+
+        # every journal has been spooled by now, so the databases see their latest state
+        for entry, tool, spooled_path, output_base in databases:
+            try:
+                entry["outputs"] = query_database(tool, spooled_path, output_base, metrics)
+            except Exception as e:
+                entry["error"] = f"{type(e).__name__}: {e}"
+    return manifest
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    with Metrics.from_args("archive_triage", args) as metrics:
+        manifest = triage_archive(args.archive_path, args.output_dir, args.decode_protobuf, args.output_format,
+                                  args.list_only, metrics)
+        manifest_file = os.path.join(args.output_dir, "manifest.json")
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f, indent=4)
+
+        for entry in manifest:
+            status = f"error: {entry['error']}" if "error" in entry else ", ".join(entry.get("outputs", []))
+            print(f"{entry['type']:<15} {entry['member']} (offset {entry['offset']}, {entry['size']} bytes) {status}")
+        print(f"Manifest of {len(manifest)} members saved to {manifest_file}")
+
+
+if __name__ == "__main__":
+    main()
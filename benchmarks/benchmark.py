@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import pathlib
+import platform
+import tempfile
+import datetime
+import contextlib
+import subprocess
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import generators
+
+__description__ = "Times every parser on synthetic artifacts and records throughput, peak RSS and latency percentiles"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+# the tools are scripts in their own folders, so each folder is put on the path
+TOOL_DIRECTORIES = ["segb_parser", "parsing_tools", "plist_parser", "iMessageQuery", "knowledgeC"]
+
+PERCENTILES = [50, 90, 95, 99]
+# A median this much slower than the baseline counts as a regression when comparing
+REGRESSION_THRESHOLD = 0.10
+
+
+def parse_arguments():
+    parser = ArgumentParser(description="A tool to benchmark the parsers on synthetic artifacts")
+    parser.add_argument("-b", "--benchmark", dest="benchmarks", action="append", choices=list(BENCHMARKS),
+                        help="Benchmark to run, can be given multiple times (default: all)")
+    parser.add_argument("-s", "--scale", type=float, default=1.0,
+                        help="Multiplies the size of every synthetic artifact (default: 1.0)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timed runs per benchmark (default: 5)")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs before timing starts (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic data (default: 0)")
+    parser.add_argument("-o", "--output", dest="output_file", help="Path to save the results JSON")
+    parser.add_argument("-c", "--compare", dest="baseline", help="Results JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help=f"Relative slowdown of the median reported as a regression (default: {REGRESSION_THRESHOLD})")
+    parser.add_argument("--work-dir", dest="work_dir", help="Directory for the synthetic artifacts (default: a temporary directory)")
+    return parser.parse_args()
+
+
+def _import_tools():
+    for directory in TOOL_DIRECTORIES:
+        path = str(REPO_ROOT / directory)
+        if path not in sys.path:
+            sys.path.append(path)
+
+
+# Runners take the artifact path and a scratch directory for output files
+
+def run_segb_stream(path, scratch):
+    from segb_parser import read_segb_stream
+    with open(path, "rb") as f:
+        for _ in read_segb_stream(f):
+            pass
+
+
+def run_segb_mmap(path, scratch):
+    from segb_parser import read_segb_file
+    for _ in read_segb_file(path, use_mmap=True):
+        pass
+
+
+def run_segb_output(path, scratch):
+    from segb_parser import run_command
+    run_command(path, os.path.join(scratch, "segb_output.json"), use_mmap=True)
+
+
+def run_segb_protobuf(path, scratch):
+    from segb_parser import run_command
+    run_command(path, os.path.join(scratch, "segb_output.ndjson"), use_mmap=True, decode_protobuf=True,
+                output_format="ndjson")
+
+
+def run_segb_carve(path, scratch):
+    from segb_parser import read_segb_file
+    for _ in read_segb_file(path, carve=True):
+        pass
+
+
+def run_cookies_parse(path, scratch):
+    from bcf_parser import read_binarycookies
+    read_binarycookies(path)
+
+
+def run_cookies_output(path, scratch):
+    from bcf_parser import Cookies
+    Cookies(path, os.path.join(scratch, "cookies"), "json")
+
+
+def run_plist(path, scratch):
+    from plist_parser import parse_plist
+    with open(path, "rb") as f:
+        parse_plist(f.read())
+
+
+def run_imessage(path, scratch):
+    from iMessageQuery import run_sqlite_query
+    run_sqlite_query(path, os.path.join(scratch, "imessage.json"))
+
+
+def run_knowledgec(path, scratch):
+    from knowledgeC import run_sqlite_query
+    run_sqlite_query(path, scratch)
+
+
+# name: (generator, generator arguments at scale 1.0, runner, artifact suffix)
+BENCHMARKS = {
+    "segb_stream": (generators.write_segb_v2, {"records": 200000}, run_segb_stream, ".segb"),
+    "segb_mmap": (generators.write_segb_v2, {"records": 200000}, run_segb_mmap, ".segb"),
+    "segb_v1": (generators.write_segb_v1, {"records": 200000}, run_segb_mmap, ".segb"),
+    "segb_output": (generators.write_segb_v2, {"records": 100000}, run_segb_output, ".segb"),
+    "segb_protobuf": (generators.write_segb_v2, {"records": 50000}, run_segb_protobuf, ".segb"),
+    "segb_carve": (generators.write_segb_v2, {"records": 50000, "deleted_every": 5}, run_segb_carve, ".segb"),
+    "cookies_parse": (generators.write_binarycookies, {"pages": 200, "cookies_per_page": 100}, run_cookies_parse, ".binarycookies"),
+    "cookies_output": (generators.write_binarycookies, {"pages": 100, "cookies_per_page": 100}, run_cookies_output, ".binarycookies"),
+    "plist_nested": (generators.write_nested_bplist, {"depth": 6, "width": 6}, run_plist, ".plist"),
+    "plist_keyed": (generators.write_keyed_archive, {"objects": 20000}, run_plist, ".plist"),
+    "imessage": (generators.write_chat_db, {"messages": 50000}, run_imessage, ".db"),
+    "knowledgec": (generators.write_knowledgec_db, {"entries": 50000}, run_knowledgec, ".db"),
+}
+
+# the size argument of each generator that --scale applies to, and what it counts
+SCALED_ARGUMENTS = {
+    generators.write_segb_v2: ("records", "records"),
+    generators.write_segb_v1: ("records", "records"),
+    generators.write_binarycookies: ("pages", "cookies"),
+    generators.write_nested_bplist: ("width", "nodes"),
+    generators.write_keyed_archive: ("objects", "objects"),
+    generators.write_chat_db: ("messages", "messages"),
+    generators.write_knowledgec_db: ("entries", "entries"),
+}
+
+
+def generate_artifact(name, scale, seed, work_dir):
+    """Writes the synthetic artifact for one benchmark, returns its path, size and item count."""
+    generator, arguments, _, suffix = BENCHMARKS[name]
+    scaled, unit = SCALED_ARGUMENTS[generator]
+    arguments = dict(arguments)
+    if generator is generators.write_nested_bplist:
+        # the tree grows as width^depth, so the width is scaled by the depth-th root
+        arguments["width"] = max(2, round(arguments["width"] * scale ** (1 / arguments["depth"])))
+    else:
+        arguments[scaled] = max(1, round(arguments[scaled] * scale))
+
+    path = os.path.join(work_dir, f"{name}_{seed}{suffix}")
+    size = generator(path, **arguments, seed=seed)
+    if generator is generators.write_binarycookies:
+        items = arguments["pages"] * arguments["cookies_per_page"]
+    elif generator is generators.write_nested_bplist:
+        items = sum(arguments["width"] ** level for level in range(arguments["depth"] + 1))
+    else:
+        items = arguments[scaled]
+    return path, size, items, unit
+
+
+def percentile(sorted_values, percent):
+    # linear interpolation between the closest ranks
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _run_benchmark(name, path, repeat, warmup):
+    """
+    Runs in a fresh process so the peak RSS belongs to this benchmark only.
+    Returns the latencies of the timed runs and the peak RSS, or the error hit.
+    """
+    _import_tools()
+    # the same peak RSS the tools report with --metrics
+    from metrics import peak_rss_bytes
+    runner = BENCHMARKS[name][2]
+    latencies = []
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as scratch:
+        try:
+            # the tools print progress, which would only measure the terminal
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                baseline_rss = peak_rss_bytes()
+                for _ in range(warmup):
+                    runner(path, scratch)
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    runner(path, scratch)
+                    latencies.append(time.perf_counter() - started)
+        except ImportError as e:
+            return {"skipped": f"missing dependency: {e.name or e}"}
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+    return {"latencies": latencies, "peak_rss_bytes": peak_rss_bytes(), "baseline_rss_bytes": baseline_rss}
+
+
+def summarize(name, size, items, unit, outcome):
+    result = {"benchmark": name, "artifact_bytes": size, "items": items, "unit": unit}
+    if "latencies" not in outcome:
+        result.update(outcome)
+        return result
+    latencies = sorted(outcome["latencies"])
+    median = percentile(latencies, 50)
+    result.update({
+        "runs": len(latencies),
+        "latency_seconds": {
+            "min": latencies[0],
+            "max": latencies[-1],
+            "mean": sum(latencies) / len(latencies),
+            **{f"p{percent}": percentile(latencies, percent) for percent in PERCENTILES}
+        },
+        "items_per_second": items / median if median else None,
+        "bytes_per_second": size / median if median else None,
+        "peak_rss_bytes": outcome["peak_rss_bytes"],
+        "baseline_rss_bytes": outcome["baseline_rss_bytes"],
+        "latencies": outcome["latencies"]
+    })
+    return result
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+        return revision.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names, scale=1.0, repeat=5, warmup=1, seed=0, work_dir=None) -> dict:
+    """
+    Generates the artifacts and runs each benchmark in its own process.
+    Returns the results document that is saved as JSON.
+    """
+    results = []
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="bench_artifacts_"))
+        os.makedirs(work_dir, exist_ok=True)
+
+        context = multiprocessing.get_context("spawn")
+        for name in names:
+            path, size, items, unit = generate_artifact(name, scale, seed, work_dir)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                outcome = executor.submit(_run_benchmark, name, path, repeat, warmup).result()
+            result = summarize(name, size, items, unit, outcome)
+            results.append(result)
+            print(format_result(result))
+
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": scale,
+        "repeat": repeat,
+        "warmup": warmup,
+        "seed": seed,
+        "results": results
+    }
+
+
+def format_result(result):
+    if "latency_seconds" not in result:
+        return f"{result['benchmark']:<16} {result.get('skipped') or result.get('error')}"
+    latency = result["latency_seconds"]
+    return (f"{result['benchmark']:<16} p50 {latency['p50'] * 1000:9.1f} ms  p99 {latency['p99'] * 1000:9.1f} ms  "
+            f"{result['items_per_second']:12,.0f} {result['unit']}/s  {result['bytes_per_second'] / (1 << 20):8.1f} MiB/s  "
+            f"peak RSS {result['peak_rss_bytes'] / (1 << 20):7.1f} MiB")
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD) -> list[str]:
+    """Prints the median and peak RSS change per benchmark, returns the names that regressed."""
+    previous = {result["benchmark"]: result for result in baseline["results"] if "latency_seconds" in result}
+    regressions = []
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'} ({baseline.get('created')}):")
+    for result in current["results"]:
+        old = previous.get(result["benchmark"])
+        if not old or "latency_seconds" not in result:
+            continue
+        if old["items"] != result["items"]:
+            print(f"{result['benchmark']:<16} not comparable, the artifact size differs")
+            continue
+        change = result["latency_seconds"]["p50"] / old["latency_seconds"]["p50"] - 1
+        rss_change = result["peak_rss_bytes"] / old["peak_rss_bytes"] - 1
+        marker = ""
+        if change > threshold:
+            marker = "  REGRESSION"
+            regressions.append(result["benchmark"])
+        print(f"{result['benchmark']:<16} median {change:+7.1%}  peak RSS {rss_change:+7.1%}{marker}")
+    return regressions
+
+
+def main():
+    args = parse_arguments()
+    results = run_benchmarks(args.benchmarks or list(BENCHMARKS), args.scale, args.repeat, args.warmup, args.seed, args.work_dir)
+
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output_file}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if compare_results(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import os
+import random
+import sqlite3
+import struct
+import zlib
+import plistlib
+import pathlib
+
+__description__ = "Writes synthetic SEGB, binarycookies, bplist, chat.db and knowledgeC.db artifacts for the benchmarks"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# Synthetic times start here (Cocoa seconds, October 2024) and move forward one record at a time
+BASE_COCOA_TIME = 750000000.0
+
+SEGB_V2_HEADER = struct.Struct("<4sid16s")
+SEGB_V2_RECORD_HEADER = struct.Struct("<Ii")
+SEGB_V2_TRAILER_ENTRY = struct.Struct("<2id")
+SEGB_V1_HEADER_SIZE = 56
+SEGB_V1_RECORD_HEADER = struct.Struct("<2i2d2I")
+
+COOKIE_HEADER = struct.Struct("<iiii6i2d")
+COOKIE_FOOTER = b"\x07\x17\x20\x05\x00\x00\x00\x4b"
+
+WORDS = "hello there lunch meeting tomorrow call back later sounds good ok running late see you soon".split()
+BUNDLE_IDS = ["com.apple.Safari", "com.apple.mail", "com.google.Chrome", "com.apple.Terminal",
+              "com.apple.MobileSMS", "com.apple.finder", "com.microsoft.VSCode", "com.spotify.client"]
+KNOWLEDGEC_STREAMS = ["/app/usage", "/app/webUsage", "/app/intents", "/device/isLocked",
+                      "/display/isBacklit", "/notification/usage", "/app/mediaUsage"]
+
+
+def _protobuf_payload(rng: random.Random, index: int, payload_size: int) -> bytes:
+    # a small protobuf message: a string, a varint, a double and a nested message padded to the size asked for
+    text = f"com.example.app{index % 100}".encode()
+    nested = b"\x0a" + bytes([len(text)]) + text + b"\x10" + bytes([index % 128])
+    filler = bytes(rng.getrandbits(7) | 0x20 for _ in range(max(0, payload_size - len(nested) - 16)))
+    payload = b"\x12" + bytes([len(nested)]) + nested
+    payload += b"\x19" + struct.pack("<d", BASE_COCOA_TIME + index)
+    if filler:
+        payload += b"\x22" + _varint(len(filler)) + filler
+    return payload
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def write_segb_v2(path, records: int, payload_size: int = 64, deleted_every: int = 0, seed: int = 0) -> int:
+    """
+    Writes a v2 SEGB file (magic first, entry table at the end).
+    Every deleted_every-th record is marked deleted. Returns the file size.
+    """
+    rng = random.Random(seed)
+    body = bytearray()
+    trailer = []
+    for index in range(records):
+        data = _protobuf_payload(rng, index, payload_size)
+        body += SEGB_V2_RECORD_HEADER.pack(zlib.crc32(data), 0)
+        body += data
+        state = 4 if deleted_every and index % deleted_every == 0 else 1
+        trailer.append(SEGB_V2_TRAILER_ENTRY.pack(len(body), state, BASE_COCOA_TIME + index))
+        body += b"\x00" * (-len(body) % 4)
+    with open(path, "wb") as f:
+        f.write(SEGB_V2_HEADER.pack(b"SEGB", records, BASE_COCOA_TIME, b"\x00" * 16))
+        f.write(body)
+        f.write(b"".join(trailer))
+    return os.path.getsize(path)
+
+
+def write_segb_v1(path, records: int, payload_size: int = 64, deleted_every: int = 0, seed: int = 0) -> int:
+    """
+    Writes a v1 SEGB file (56 byte header with the magic at offset 52,
+    32 byte record headers, records aligned to 8 bytes). Returns the file size.
+    """
+    rng = random.Random(seed)
+    body = bytearray(SEGB_V1_HEADER_SIZE)
+    for index in range(records):
+        data = _protobuf_payload(rng, index, payload_size)
+        state = 3 if deleted_every and index % deleted_every == 0 else 1
+        body += SEGB_V1_RECORD_HEADER.pack(len(data), state, BASE_COCOA_TIME + index, BASE_COCOA_TIME + index + 1,
+                                           zlib.crc32(data), 0)
+        body += data
+        body += b"\x00" * (-len(body) % 8)
+    body[0:4] = struct.pack("<i", len(body))
+    body[52:56] = b"SEGB"
+    with open(path, "wb") as f:
+        f.write(body)
+    return os.path.getsize(path)
+
+
+def _cookie(rng: random.Random, index: int) -> bytes:
+    strings = [f".example{index % 500}.com".encode(), f"name{index}".encode(), b"/",
+               f"value-{index}-".encode() + bytes(rng.choice(b"abcdef0123456789") for _ in range(rng.randint(0, 64)))]
+    offsets = []
+    offset = COOKIE_HEADER.size
+    for string in strings:
+        offsets.append(offset)
+        offset += len(string) + 1
+    body = b"".join(string + b"\x00" for string in strings)
+    header = COOKIE_HEADER.pack(COOKIE_HEADER.size + len(body), 0, rng.choice([0, 1, 4, 5]), 0, *offsets, 0, 0,
+                                BASE_COCOA_TIME + index * 1000.5, BASE_COCOA_TIME - 86400 + index)
+    return header + body
+
+
+def write_binarycookies(path, pages: int, cookies_per_page: int, seed: int = 0) -> int:
+    """Writes a Cookies.binarycookies file with the given layout. Returns the file size."""
+    rng = random.Random(seed)
+    page_blobs = []
+    for page_index in range(pages):
+        cookies = [_cookie(rng, page_index * cookies_per_page + index) for index in range(cookies_per_page)]
+        offset = 8 + 4 * len(cookies) + 4
+        offsets = []
+        for cookie in cookies:
+            offsets.append(offset)
+            offset += len(cookie)
+        page_blobs.append(struct.pack("<ii", 0x100, len(cookies)) + struct.pack(f"<{len(cookies)}i", *offsets)
+                          + b"\x00\x00\x00\x00" + b"".join(cookies))
+    with open(path, "wb") as f:
+        f.write(b"cook" + struct.pack(">i", pages))
+        f.write(b"".join(struct.pack(">i", len(page)) for page in page_blobs))
+        f.write(b"".join(page_blobs))
+        f.write(b"\x00\x00\x00\x00" + COOKIE_FOOTER + b"bplist00")
+    return os.path.getsize(path)
+
+
+def _nested_value(rng: random.Random, depth: int, width: int):
+    if depth == 0:
+        return rng.choice([rng.randint(0, 1 << 40), " ".join(rng.choices(WORDS, k=4)), rng.random(), True,
+                           bytes(rng.getrandbits(8) for _ in range(16))])
+    if depth % 2:
+        return [_nested_value(rng, depth - 1, width) for _ in range(width)]
+    value = {f"key{index}": _nested_value(rng, depth - 1, width) for index in range(width)}
+    # an embedded binary plist, the way NSKeyedArchiver data shows up inside other plists
+    value["bytes"] = plistlib.dumps({"embedded": depth, "name": rng.choice(WORDS)}, fmt=plistlib.FMT_BINARY)
+    return value
+
+
+def write_nested_bplist(path, depth: int = 6, width: int = 6, seed: int = 0) -> int:
+    """Writes a binary plist of nested dicts and lists with embedded bplists. Returns the file size."""
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        plistlib.dump({"root": _nested_value(rng, depth, width)}, f, fmt=plistlib.FMT_BINARY)
+    return os.path.getsize(path)
+
+
+def write_keyed_archive(path, objects: int, seed: int = 0) -> int:
+    """
+    Writes an NSKeyedArchiver style binary plist: a flat $objects table of
+    dictionaries that point at each other through UIDs. Returns the file size.
+    """
+    rng = random.Random(seed)
+    table = ["$null", {"$classname": "NSMutableDictionary", "$classes": ["NSMutableDictionary", "NSDictionary", "NSObject"]}]
+    for index in range(objects):
+        text_uid = len(table) + 1
+        table.append({
+            "$class": plistlib.UID(1),
+            "NS.keys": [plistlib.UID(text_uid)],
+            "NS.objects": [plistlib.UID(rng.randint(2, max(2, len(table) - 1)))],
+            "index": index,
+            "time": BASE_COCOA_TIME + index,
+        })
+        table.append(" ".join(rng.choices(WORDS, k=3)))
+    archive = {"$version": 100000, "$archiver": "NSKeyedArchiver", "$top": {"root": plistlib.UID(2)}, "$objects": table}
+    with open(path, "wb") as f:
+        plistlib.dump(archive, f, fmt=plistlib.FMT_BINARY)
+    return os.path.getsize(path)
+
+
+def write_chat_db(path, messages: int, handles: int = 200, chats: int = 20, members_per_chat: int = 6,
+                  attachment_every: int = 10, seed: int = 0) -> int:
+    """
+    Writes a chat.db with the tables iMessageQuery reads (message, handle,
+    chat, chat_handle_join, attachment, message_attachment_join). Returns the file size.
+    """
+    rng = random.Random(seed)
+    path = pathlib.Path(path)
+    if path.exists():
+        path.unlink()
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE handle (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, service TEXT NOT NULL);
+        CREATE TABLE chat (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, guid TEXT, chat_identifier TEXT, service_name TEXT,
+                           room_name TEXT, display_name TEXT);
+        CREATE TABLE chat_handle_join (chat_id INTEGER, handle_id INTEGER, UNIQUE(chat_id, handle_id));
+        CREATE TABLE message (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, guid TEXT UNIQUE NOT NULL, text TEXT,
+                              handle_id INTEGER DEFAULT 0, service TEXT, account TEXT, date INTEGER,
+                              is_from_me INTEGER DEFAULT 0, cache_roomnames TEXT, cache_has_attachments INTEGER DEFAULT 0);
+        CREATE TABLE attachment (ROWID INTEGER PRIMARY KEY AUTOINCREMENT, guid TEXT, filename TEXT, mime_type TEXT,
+                                 transfer_name TEXT, total_bytes INTEGER);
+        CREATE TABLE message_attachment_join (message_id INTEGER, attachment_id INTEGER);
+        CREATE TABLE chat_message_join (chat_id INTEGER, message_id INTEGER, message_date INTEGER);
+    """)
+    connection.executemany("INSERT INTO handle VALUES (?, ?, ?)",
+                           [(index, f"+1555{index:07d}", "iMessage") for index in range(1, handles + 1)])
+    for chat in range(1, chats + 1):
+        connection.execute("INSERT INTO chat VALUES (?, ?, ?, ?, ?, ?)",
+                           (chat, f"iMessage;+;chat{chat}", f"chat{chat}", "iMessage", f"chat{chat}", f"Group {chat}"))
+        members = rng.sample(range(1, handles + 1), min(members_per_chat, handles))
+        connection.executemany("INSERT INTO chat_handle_join VALUES (?, ?)", [(chat, handle) for handle in members])
+
+    message_rows = []
+    attachment_rows = []
+    join_rows = []
+    for rowid in range(1, messages + 1):
+        room = f"chat{rng.randint(1, chats)}" if chats and rng.random() < 0.3 else None
+        has_attachment = attachment_every and rowid % attachment_every == 0
+        message_rows.append((rowid, f"message-{rowid}", " ".join(rng.choices(WORDS, k=rng.randint(2, 12))),
+                             rng.randint(1, handles), "iMessage", "e:owner@example.com",
+                             int((BASE_COCOA_TIME + rowid * 30) * 1e9), rng.randint(0, 1), room, int(bool(has_attachment))))
+        if has_attachment:
+            attachment_rows.append((rowid, f"attachment-{rowid}", f"~/Library/Messages/Attachments/{rowid % 256:02x}/{rowid}/IMG_{rowid}.jpeg",
+                                    "image/jpeg", f"IMG_{rowid}.jpeg", rng.randint(10000, 5000000)))
+            join_rows.append((rowid, rowid))
+    connection.executemany("INSERT INTO message VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", message_rows)
+    connection.executemany("INSERT INTO attachment VALUES (?, ?, ?, ?, ?, ?)", attachment_rows)
+    connection.executemany("INSERT INTO message_attachment_join VALUES (?, ?)", join_rows)
+    connection.commit()
+    connection.close()
+    return os.path.getsize(path)
+
+
+def write_knowledgec_db(path, entries: int, seed: int = 0) -> int:
+    """
+    Writes a knowledgeC.db with the ZOBJECT, ZSTRUCTUREDMETADATA and ZSOURCE
+    columns knowledgeC.py reads. Returns the file size.
+    """
+    rng = random.Random(seed)
+    path = pathlib.Path(path)
+    if path.exists():
+        path.unlink()
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE ZOBJECT (Z_PK INTEGER PRIMARY KEY, ZCREATIONDATE TIMESTAMP, ZSTARTDAYOFWEEK INTEGER,
+                              ZSTARTDATE TIMESTAMP, ZENDDATE TIMESTAMP, ZSTREAMNAME VARCHAR, ZVALUESTRING VARCHAR,
+                              ZSTRUCTUREDMETADATA INTEGER, ZSOURCE INTEGER);
+        CREATE INDEX ZOBJECT_ZSTARTDATE_INDEX ON ZOBJECT (ZSTARTDATE);
+        CREATE TABLE ZSTRUCTUREDMETADATA (Z_PK INTEGER PRIMARY KEY,
+                                          Z_DKAPPLICATIONACTIVITYMETADATAKEY__ACTIVITYTYPE VARCHAR,
+                                          Z_DKAPPLICATIONACTIVITYMETADATAKEY__TITLE VARCHAR,
+                                          Z_DKAPPLICATIONACTIVITYMETADATAKEY__USERACTIVITYREQUIREDSTRING VARCHAR,
+                                          Z_DKAPPLICATIONACTIVITYMETADATAKEY__EXPIRATIONDATE TIMESTAMP,
+                                          Z_CDENTITYMETADATAKEY__NAME VARCHAR,
+                                          Z_DKINTENTMETADATAKEY__INTENTCLASS VARCHAR,
+                                          Z_DKINTENTMETADATAKEY__INTENTVERB VARCHAR,
+                                          Z_DKINTENTMETADATAKEY__SERIALIZEDINTERACTION BLOB,
+                                          Z_DKDIGITALHEALTHMETADATAKEY__WEBPAGEURL VARCHAR);
+        CREATE TABLE ZSOURCE (Z_PK INTEGER PRIMARY KEY, ZBUNDLEID VARCHAR, ZGROUPID VARCHAR, ZITEMID VARCHAR);
+    """)
+    connection.executemany("INSERT INTO ZSOURCE VALUES (?, ?, NULL, NULL)",
+                           [(index, bundle_id) for index, bundle_id in enumerate(BUNDLE_IDS, 1)])
+    objects = []
+    metadata = []
+    for index in range(1, entries + 1):
+        start = BASE_COCOA_TIME + index * 120 + rng.random() * 60
+        bundle = rng.randint(1, len(BUNDLE_IDS))
+        metadata.append((index, "NSUserActivityTypeBrowsingWeb", " ".join(rng.choices(WORDS, k=3)), None,
+                         start + 86400, None, None, None, None, f"https://example{index % 300}.com/{index}"))
+        objects.append((index, start, int(start // 86400) % 7 + 1, start, start + rng.randint(1, 1800),
+                        rng.choice(KNOWLEDGEC_STREAMS), BUNDLE_IDS[bundle - 1], index, bundle))
+    connection.executemany("INSERT INTO ZSTRUCTUREDMETADATA VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", metadata)
+    connection.executemany("INSERT INTO ZOBJECT VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", objects)
+    connection.commit()
+    connection.close()
+    return os.path.getsize(path)
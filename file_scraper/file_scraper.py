@@ -1,58 +1,300 @@
 import os
 import os.path
-from argparse import ArgumentParser
+import sys
+import json
+import fnmatch
+import pathlib
+from argparse import ArgumentParser, ArgumentTypeError
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "parsing_tools"))
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
+from file_hash import sha256_file
+from cocoa_time import parse_time_argument
 
 __description__ = "Recursively searches through a directory and extracts all files with a specified extension"
 __organization__ = "Omen-Cyber"
 __contact__ = "DaKota LaFeber"
 
-def parse_arguments():
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+# results of matching a directory against an --include rule
+NO_MATCH, PARTIAL, MATCH = range(3)
+
+def parse_arguments(argv=None):
     parser = ArgumentParser(description="A tool to extract files in a directory")
-    parser.add_argument("-d", "--directory", dest="starting_directory", required=True, help="Starting directory for the search")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-d", "--directory", dest="starting_directory", help="Starting directory for the search")
+    source.add_argument("-a", "--archive", dest="archive_path", help="tar or zip archive to search instead of a directory, nothing is extracted")
     parser.add_argument("-t", "--file-type", dest="file_type", required=True, choices=['db', 'plist', 'ips'], help="Type of files to search for (db, plist, ips)")
     parser.add_argument("-o", "--output-file", dest="output_file", help="Path to the output file")
-    return parser.parse_args()
+    parser.add_argument("--dedup", dest="dedup_file", help="Hash the found files and save a JSON map of each unique content and all of its paths")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, help="Number of hashing threads for --dedup")
+    parser.add_argument("--include", dest="include", action="append", default=[],
+                        help="Only search below directories matching this glob, relative to the start (e.g. 'Users/*/Library/**'), can be repeated")
+    parser.add_argument("--exclude", dest="exclude", action="append", default=[],
+                        help="Skip files and whole directories matching this glob: a name anywhere (node_modules) or, with a '/', a path from the start (/System), can be repeated")
+    parser.add_argument("--min-size", dest="min_size", type=parse_size_argument, help="Only files of at least this size (bytes, or with K, M, G)")
+    parser.add_argument("--max-size", dest="max_size", type=parse_size_argument, help="Only files of at most this size (bytes, or with K, M, G)")
+    parser.add_argument("--newer", dest="newer", type=parse_time_argument, help="Only files modified at or after this local time (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("--older", dest="older", type=parse_time_argument, help="Only files modified before this local time (YYYY-MM-DD[ HH:MM:SS])")
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.archive_path and args.dedup_file:
+        parser.error("--dedup needs files on disk, use -d")
+    return args
+
+def parse_size_argument(value):
+    number, unit = value.strip(), ""
+    if number[-1:].upper() in SIZE_UNITS:
+        number, unit = number[:-1], number[-1].upper()
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise ArgumentTypeError(f"invalid size: {value}")
+
+
+def _split_pattern(pattern):
+    return [part for part in pattern.strip("/").split("/") if part not in ("", ".")]
+
+
+def _match_directory(parts, pattern):
+    """
+    Matches the path components of a directory against a glob pattern's,
+    where ** stands for any number of components. Returns MATCH when the
+    directory matches (so everything below it does too), PARTIAL when a
+    directory below it still could, and NO_MATCH otherwise.
+    """
+    if not pattern:
+        return MATCH
+    if not parts:
+        return MATCH if all(part == "**" for part in pattern) else PARTIAL
+    if pattern[0] == "**":
+        if _match_directory(parts, pattern[1:]) == MATCH or _match_directory(parts[1:], pattern) == MATCH:
+            return MATCH
+        return PARTIAL
+    if fnmatch.fnmatch(parts[0], pattern[0]):
+        return _match_directory(parts[1:], pattern[1:])
+    return NO_MATCH
+
+
+class PathFilter:
+    """
+    Decides which directories a walk enters and which files it keeps.
+    Directories are checked before they are opened, so excluded trees and
+    trees outside every --include are never read. Paths are given as their
+    components relative to the starting directory.
+    """
+
+    def __init__(self, include=(), exclude=(), min_size=None, max_size=None, newer=None, older=None):
+        self.include = [_split_pattern(pattern) for pattern in include]
+        # patterns with a / are anchored to the start, the others match a name at any depth
+        self.exclude_paths = [_split_pattern(pattern) for pattern in exclude if "/" in pattern]
+        self.exclude_names = [pattern for pattern in exclude if "/" not in pattern]
+        self.min_size = min_size
+        self.max_size = max_size
+        self.newer = newer
+        self.older = older
+        # only these predicates need a stat of each candidate file
+        self.needs_stat = any(value is not None for value in (min_size, max_size, newer, older))
+
+    def _excluded(self, parts):
+        if any(fnmatch.fnmatch(parts[-1], pattern) for pattern in self.exclude_names):
+            return True
+        return any(_match_directory(parts, pattern) == MATCH for pattern in self.exclude_paths)
+
+    def _included(self, parts):
+        if not self.include:
+            return MATCH
+        return max(_match_directory(parts, pattern) for pattern in self.include)
+
+    def enter_directory(self, parts) -> bool:
+        return not self._excluded(parts) and self._included(parts) != NO_MATCH
+
+    def keep_file(self, parts, size=None, mtime=None) -> bool:
+        if self._excluded(parts) or self._included(parts[:-1]) != MATCH:
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.newer is not None and (mtime is None or mtime < self.newer):
+            return False
+        if self.older is not None and (mtime is None or mtime >= self.older):
+            return False
+        return True
+
+    def keep_path(self, parts, size=None, mtime=None) -> bool:
+        """keep_file for a path that wasn't reached by a walk, such as an archive member, so its directories are checked too."""
+        return (all(self.enter_directory(parts[:depth]) for depth in range(1, len(parts)))
+                and self.keep_file(parts, size, mtime))
+
+
+NO_FILTER = PathFilter()
 
 '''
 Searches for files with specified extension
 In the directory and its subdirectories
-Then outputs them to a specified file
+Then outputs them to a specified file.
+Symlinked directories are followed, but every directory is
+entered only once (by device and inode), so links can't loop.
 '''
-def find_files(starting_directory, file_extension, output_file=None):
-    # using stack for recursive file traversal
-    stack = [os.path.expanduser(starting_directory)]
+def find_files(starting_directory, file_extension, output_file=None, metrics=NO_METRICS, path_filter=NO_FILTER):
+    root = os.path.expanduser(starting_directory)
+    # using stack for recursive file traversal, with each directory's components below the root
+    stack = [(root, ())]
     found_files = []
+    suffix = "." + file_extension
+    root_stat = os.stat(root)
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
 
     # looking for files and adding them to the array
-    while stack:
-        current_directory = stack.pop()
-        for item in os.listdir(current_directory):
-            full_path = os.path.join(current_directory, item)
-            if os.path.isfile(full_path) and item.endswith("." + file_extension):
-                found_files.append(full_path)
-            elif os.path.isdir(full_path):
-                stack.append(full_path)
-
-    if output_file:
-        with open(output_file, "w") as f:
+    with metrics.stage("walk"):
+        while stack:
+            current_directory, current_parts = stack.pop()
+            metrics.count("walk", directories=1)
+            try:
+                entries = list(os.scandir(current_directory))
+            except OSError:
+                metrics.count("walk", errors=1)
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        if not entry.name.endswith(suffix):
+                            continue
+                        parts = current_parts + (entry.name,)
+                        if path_filter.needs_stat:
+                            entry_stat = entry.stat()
+                            keep = path_filter.keep_file(parts, entry_stat.st_size, entry_stat.st_mtime)
+                        else:
+                            keep = path_filter.keep_file(parts)
+                        if keep:
+                            found_files.append(entry.path)
+                    elif entry.is_dir():
+                        parts = current_parts + (entry.name,)
+                        if not path_filter.enter_directory(parts):
+                            metrics.count("walk", pruned=1)
+                            continue
+                        entry_stat = entry.stat()
+                        key = (entry_stat.st_dev, entry_stat.st_ino)
+                        if key in visited:
+                            metrics.count("walk", loops=1)
+                            continue
+                        visited.add(key)
+                        stack.append((entry.path, parts))
+                except OSError:
+                    metrics.count("walk", errors=1)
+    metrics.count("walk", files=len(found_files))
+
+    with metrics.stage("write"):
+        if output_file:
+            with open(output_file, "w") as f:
+                for file_path in found_files:
+                    f.write(file_path + "\n")
+        else:
             for file_path in found_files:
-                f.write(file_path + "\n")
-    else:
-        for file_path in found_files:
-            print(file_path)
+                print(file_path)
+    return found_files
+
+
+'''
+Same as find_files for the members of a tar or zip archive,
+read in one pass without extracting anything.
+Each member is listed with its offset in the archive.
+'''
+def find_archive_members(archive_path, file_extension, output_file=None, metrics=NO_METRICS, path_filter=NO_FILTER):
+    # tarfile and zipfile are only loaded for -a
+    from archive_reader import list_archive_members
+    with metrics.stage("walk"):
+        members = [member for member in list_archive_members(archive_path)
+                   if member.name.endswith("." + file_extension)
+                   and path_filter.keep_path(tuple(_split_pattern(member.name)), member.size, member.mtime)]
+    metrics.count("walk", files=len(members))
+
+    lines = [f"{member.name}\t{member.offset}" for member in members]
+    with metrics.stage("write"):
+        if output_file:
+            with open(output_file, "w") as f:
+                for line in lines:
+                    f.write(line + "\n")
+        else:
+            for line in lines:
+                print(line)
+    return members
+
+
+def _hash_or_error(file_path):
+    try:
+        return sha256_file(file_path), None
+    except OSError as e:
+        return None, str(e)
+
+
+def _unreadable_group(file_path, error):
+    return {"path": file_path, "size": None, "sha256": None, "paths": [file_path], "error": error}
+
+'''
+Groups files by content so each copy only has to be parsed once.
+Files are grouped by size first: a file whose size no other file has
+is unique without being read, so only files sharing a size are hashed.
+Hashing runs in a thread pool, hashlib releases the GIL on large blocks.
+Returns one group per unique content with its first path, size,
+SHA-256 (None when it didn't need hashing) and every path holding it.
+'''
+def find_duplicates(file_paths, workers=None, metrics=NO_METRICS):
+    groups = []
+    by_size = {}
+    with metrics.stage("stat"):
+        for file_path in file_paths:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError as e:
+                groups.append(_unreadable_group(file_path, str(e)))
+                continue
+            by_size.setdefault(size, []).append(file_path)
+
+    to_hash = []
+    for size, paths in by_size.items():
+        if len(paths) == 1:
+            groups.append({"path": paths[0], "size": size, "sha256": None, "paths": paths})
+        else:
+            to_hash.extend((file_path, size) for file_path in paths)
+
+    from concurrent.futures import ThreadPoolExecutor
+    by_digest = {}
+    with metrics.stage("hash"), ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_hash_or_error, [file_path for file_path, _ in to_hash])
+        for (file_path, size), (digest, error) in zip(to_hash, results):
+            if error is not None:
+                groups.append(_unreadable_group(file_path, error))
+                continue
+            metrics.count("hash", files=1, bytes=size)
+            group = by_digest.get(digest)
+            if group is None:
+                group = by_digest[digest] = {"path": file_path, "size": size, "sha256": digest, "paths": []}
+                groups.append(group)
+            group["paths"].append(file_path)
+    return groups
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    newer = args.newer.timestamp() if args.newer else None
+    older = args.older.timestamp() if args.older else None
+    path_filter = PathFilter(args.include, args.exclude, args.min_size, args.max_size, newer, older)
+    with Metrics.from_args("file_scraper", args) as metrics:
+        if args.archive_path:
+            find_archive_members(args.archive_path, args.file_type, args.output_file, metrics, path_filter)
+        else:
+            found_files = find_files(args.starting_directory, args.file_type, args.output_file, metrics, path_filter)
+
+        if args.dedup_file:
+            groups = find_duplicates(found_files, args.workers, metrics)
+            with open(args.dedup_file, "w") as f:
+                json.dump(groups, f, indent=4)
+            copies = sum(len(group["paths"]) - 1 for group in groups)
+            print(f"{len(found_files)} files, {len(groups)} unique contents, {copies} duplicate copies")
+            print(f"Deduplication map saved to {args.dedup_file}")
+
 
 if __name__ == "__main__":
-    args = parse_arguments()
-    starting_directory = args.starting_directory
-    file_type = args.file_type
-    output_file = args.output_file
-
-    if output_file:
-        find_files(starting_directory, file_type, output_file)
-    else:
-        if file_type == 'db':
-            find_files(starting_directory, 'db')
-        elif file_type == 'plist':
-            find_files(starting_directory, 'plist')
-        elif file_type == 'ips':
-            find_files(starting_directory, 'ips')
\ No newline at end of file
+    main()
@@ -0,0 +1,108 @@
+import os
+import pathlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# only imported by iMessageQuery.py, which puts parsing_tools on the path
+from metrics import NO_METRICS
+from file_hash import sha256_file
+
+__description__ = "Finds the files that iMessage attachment records point to in a collection, and stats and hashes them"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# at most this many files per worker are queued, so thousands of attachments never become thousands of futures
+QUEUE_SIZE_PER_WORKER = 4
+
+
+def default_home(database_path, evidence_root) -> pathlib.Path:
+    """
+    The home folder that ~ in attachment paths stands for: the folder chat.db was
+    collected from when it sits in <home>/Library/Messages, otherwise the evidence root.
+    """
+    database_path = pathlib.Path(database_path)
+    if [part.lower() for part in database_path.parts[-3:-1]] == ["library", "messages"]:
+        return database_path.parents[2]
+    return pathlib.Path(evidence_root)
+
+
+def resolve_attachment_path(path: str, evidence_root, home) -> pathlib.Path:
+    """
+    Maps an attachment.filename onto the collection: ~/... is looked up in the home
+    folder, absolute paths (/Users/..., /var/mobile/...) below the evidence root.
+    The path comes from the evidence, so after .. and symlinks are resolved it has
+    to stay inside that folder, otherwise ValueError is raised.
+    """
+    if path == "~" or path.startswith("~/"):
+        root, relative_path = pathlib.Path(home).resolve(), path[2:]
+    else:
+        root, relative_path = pathlib.Path(evidence_root).resolve(), path.lstrip("/")
+    resolved_path = (root / relative_path).resolve()
+    if not resolved_path.is_relative_to(root):
+        raise ValueError(f"{path} resolves outside {root}")
+    return resolved_path
+
+
+def _outside_root(error: ValueError) -> dict:
+    # nothing outside the collection is stat'ed or hashed
+    return {"ResolvedPath": None, "Exists": False, "FileSize": None, "SHA256": None, "Error": str(error)}
+
+
+def attachment_metadata(resolved_path: pathlib.Path) -> dict:
+    """Whether the resolved file exists, its size and SHA-256, and the error if it couldn't be read."""
+    metadata = {"ResolvedPath": str(resolved_path), "Exists": False, "FileSize": None, "SHA256": None}
+    try:
+        size = os.stat(resolved_path).st_size
+    except FileNotFoundError:
+        return metadata
+    except OSError as e:
+        metadata["Error"] = str(e)
+        return metadata
+    metadata["Exists"] = True
+    metadata["FileSize"] = size
+    try:
+        metadata["SHA256"] = sha256_file(resolved_path)
+    except OSError as e:
+        metadata["Error"] = str(e)
+    return metadata
+
+
+def resolve_attachments(paths, evidence_root, home=None, workers=None, metrics=NO_METRICS) -> dict[str, dict]:
+    """
+    Resolves, stats and hashes the files behind attachment paths in a thread pool.
+    Each distinct path is only read once, and only a bounded number of files are
+    queued on the pool at a time. Paths that lead outside the collection are
+    rejected without being touched. Returns a dictionary of attachment path to
+    its metadata (ResolvedPath, Exists, FileSize, SHA256 and any Error).
+    """
+    if home is None:
+        home = evidence_root
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    queue_size = workers * QUEUE_SIZE_PER_WORKER
+    results = {}
+    pending = collections.deque()
+
+    def collect():
+        path, future = pending.popleft()
+        metadata = results[path] = future.result()
+        if metadata["Exists"]:
+            metrics.count("attachments", found=1, bytes=metadata["FileSize"])
+        else:
+            metrics.count("attachments", missing=1)
+
+    with metrics.stage("attachments"), ThreadPoolExecutor(max_workers=workers) as executor:
+        for path in dict.fromkeys(paths):
+            if not path:
+                continue
+            if len(pending) >= queue_size:
+                collect()
+            try:
+                resolved_path = resolve_attachment_path(path, evidence_root, home)
+            except ValueError as e:
+                results[path] = _outside_root(e)
+                metrics.count("attachments", rejected=1)
+                continue
+            pending.append((path, executor.submit(attachment_metadata, resolved_path)))
+        while pending:
+            collect()
+    return results
@@ -1,16 +1,32 @@
 import sqlite3
 import json
+import sys
+import pathlib
 from argparse import ArgumentParser
 
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "parsing_tools"))
+from case_store import CaseStore
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
+from participants import read_participants
 
-def parse_arguments():
+
+def parse_arguments(argv=None):
     parser = ArgumentParser(description="A tool to extract data from the chat.db file")
     parser.add_argument("-f", "--file", dest="database_path", required=True, help="Path to the chat.db file")
     parser.add_argument("-o", "--output", dest="output_dir", help="Path to the output directory")
-    return parser.parse_args()
-
-
-def run_sqlite_query(database_path, output_dir):
+    parser.add_argument("--case-db", dest="case_db", help="Also load the messages into this case SQLite database")
+    parser.add_argument("--index", dest="index_path", help="Also build a full-text search index of the messages in this file (search it with message_index.py)")
+    parser.add_argument("--evidence-root", dest="evidence_root", help="Root of the collection, attachments are looked up, stat'ed and hashed below it")
+    parser.add_argument("--home", dest="home", help="Home folder in the collection that ~ in attachment paths stands for (default: the one chat.db is in)")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, help="Number of threads that stat and hash attachments")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def run_sqlite_query(database_path, output_dir, case_db=None, metrics=NO_METRICS, evidence_root=None, home=None,
+                     workers=None):
+    connection = None
+    case_store = CaseStore(case_db) if case_db else None
     try:
         # Connect to the SQLite database
         connection = sqlite3.connect(database_path)
@@ -23,7 +39,7 @@ def run_sqlite_query(database_path, output_dir):
                 COALESCE(m.cache_roomnames, h.id) AS ThreadId,
                 m.is_from_me AS IsFromMe,
                 CASE WHEN m.is_from_me = 1 THEN m.account ELSE h.id END AS FromPhoneNumber,
-                CASE WHEN m.is_from_me = 0 THEN m.account ELSE COALESCE(h2.id, h.id) END AS ToPhoneNumber,
+                CASE WHEN m.is_from_me = 0 THEN m.account ELSE h.id END AS ToPhoneNumber,
                 m.service AS Service,
                 DATETIME((m.date / 1000000000) + 978307200, 'unixepoch', 'localtime') AS TextDate,
                 m.text AS MessageText,
@@ -31,50 +47,84 @@ def run_sqlite_query(database_path, output_dir):
                 a.filename AS att_path,
                 a.mime_type AS att_mime_type,
                 a.transfer_name AS att_name,
-                a.total_bytes AS att_size
+                a.total_bytes AS att_size,
+                (m.date / 1000000000.0) + 978307200 AS TextEpoch,
+                m.cache_roomnames
             FROM 
                 message AS m
             LEFT JOIN 
                 handle AS h ON m.handle_id = h.rowid
             LEFT JOIN 
                 chat AS c ON m.cache_roomnames = c.room_name
-            LEFT JOIN 
-                chat_handle_join AS ch ON c.rowid = ch.chat_id
-            LEFT JOIN 
-                handle AS h2 ON ch.handle_id = h2.rowid
             LEFT JOIN
                 message_attachment_join AS ma ON ma.message_id = m.rowid
             LEFT JOIN
                 attachment AS a ON a.rowid = ma.attachment_id    
-            WHERE
-                (h2.service IS NULL OR m.service = h2.service)
             ORDER BY
                 2, m.date;
         """
 
-        # Execute the query
-        cursor.execute(query)
+        with metrics.stage("query"):
+            participants = read_participants(cursor)
+
+            # Execute the query
+            cursor.execute(query)
+
+            # Fetch all rows from the result set
+            rows = cursor.fetchall()
+        metrics.count("query", rows=len(rows))
 
-        # Fetch all rows from the result set
-        rows = cursor.fetchall()
+        # the files behind the attachments are looked up before the records are built
+        attachment_files = {}
+        if evidence_root:
+            from attachments import default_home, resolve_attachments
+            home = home or default_home(database_path, evidence_root)
+            attachment_files = resolve_attachments((row[9] for row in rows), evidence_root, home, workers, metrics)
 
         # Construct a list of dictionaries representing each row
         result_list = []
         for row in rows:
-            result_dict = {
-                "From": row[3],
-                "To": row[4],
-                "Service": row[5],
-                "Date": row[6],
-                "Message": row[7],
-                "Attachment": {
-                    "Path": row[9],
-                    "MimeType": row[10],
-                    "Name": row[11],
-                    "Size": row[12]
-                } if row[9] else None
-            }
-            result_list.append(result_dict)
+            with metrics.stage("convert"):
+                recipient = row[4]
+                # messages I sent to a group chat go to everyone in it on the same service
+                if row[2] and row[14] in participants:
+                    recipients = [handle for handle, service in participants[row[14]] if service is None or service == row[5]]
+                    if recipients:
+                        recipient = ", ".join(recipients)
+                result_dict = {
+                    "From": row[3],
+                    "To": recipient,
+                    "Service": row[5],
+                    "Date": row[6],
+                    # Unix seconds (UTC) of the same time, with its sub-second part
+                    "Epoch": row[13],
+                    "Message": row[7],
+                    "Attachment": {
+                        "Path": row[9],
+                        "MimeType": row[10],
+                        "Name": row[11],
+                        "Size": row[12]
+                    } if row[9] else None
+                }
+                if row[9] in attachment_files:
+                    result_dict["Attachment"].update(attachment_files[row[9]])
+                result_list.append(result_dict)
+
+            if case_store:
+                with metrics.stage("case_db"):
+                    case_store.add("imessage", {
+                        "timestamp": row[13],
+                        "thread": row[1],
+                        # the other side of the conversation
+                        "handle": recipient if row[2] else row[3],
+                        "sender": row[3],
+                        "recipient": recipient,
+                        "service": row[5],
+                        "message": row[7],
+                        "attachment_path": row[9],
+                        "source": str(database_path),
+                        "record": result_dict
+                    })
 
         # Determine the output file path
         output_file = "output.json"
@@ -82,8 +132,10 @@ def run_sqlite_query(database_path, output_dir):
             output_file = output_dir
 
         # Dump the list into a JSON file
-        with open(output_file, "w") as json_file:
-            json.dump(result_list, json_file, indent=4)
+        with metrics.stage("write"):
+            with open(output_file, "w") as json_file:
+                json.dump(result_list, json_file, indent=4)
+                metrics.count("write", records=len(result_list), bytes=json_file.tell())
 
         print("Query results have been saved to:", output_file)
 
@@ -94,15 +146,28 @@ def run_sqlite_query(database_path, output_dir):
         # Close the database connection
         if connection:
             connection.close()
+        if case_store:
+            with metrics.stage("case_db"):
+                case_store.close()
+            print("Messages have been loaded into:", case_db)
 
 
 # Main function
-def main():
+def main(argv=None):
     # Parse command line arguments
-    args = parse_arguments()
+    args = parse_arguments(argv)
 
     # Run the SQLite query
-    run_sqlite_query(args.database_path, args.output_dir)
+    with Metrics.from_args("iMessageQuery", args) as metrics:
+        run_sqlite_query(args.database_path, args.output_dir, args.case_db, metrics, args.evidence_root, args.home,
+                         args.workers)
+        if args.index_path:
+            from message_index import build_index
+            try:
+                total = build_index(args.database_path, args.index_path, metrics=metrics)
+                print(f"{total} messages have been indexed into:", args.index_path)
+            except (sqlite3.Error, ValueError) as e:
+                print("Index error:", e)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import sqlite3
+import pathlib
+from argparse import ArgumentParser
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "parsing_tools"))
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
+from cocoa_time import COCOA_EPOCH_OFFSET
+from participants import read_participants
+
+__description__ = "Builds and searches an SQLite FTS5 full-text index of the messages in a chat.db file"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# Messages are read from chat.db and inserted into the index this many at a time
+BATCH_SIZE = 10000
+
+# one row per message, attachment names are aggregated so a message is never repeated
+MESSAGES_QUERY = """
+    SELECT
+        m.rowid,
+        COALESCE(m.cache_roomnames, h.id) AS ThreadId,
+        c.display_name AS RoomName,
+        (m.date / 1000000000.0) + {cocoa_to_unix} AS TextEpoch,
+        m.is_from_me,
+        m.account,
+        h.id,
+        m.service,
+        m.text,
+        {attributed_body} AS attributedBody,
+        attachments.names,
+        m.cache_roomnames
+    FROM
+        message AS m
+    LEFT JOIN
+        handle AS h ON m.handle_id = h.rowid
+    LEFT JOIN
+        chat AS c ON m.cache_roomnames = c.room_name
+    LEFT JOIN (
+        SELECT ma.message_id, GROUP_CONCAT(COALESCE(a.transfer_name, a.filename), char(10)) AS names
+        FROM message_attachment_join AS ma
+        JOIN attachment AS a ON a.rowid = ma.attachment_id
+        GROUP BY ma.message_id
+    ) AS attachments ON attachments.message_id = m.rowid
+"""
+
+# messages holds the content, messages_fts indexes text, body, handles and attachments from it
+INDEX_SCHEMA = """
+    DROP TABLE IF EXISTS messages_fts;
+    DROP TABLE IF EXISTS messages;
+    CREATE TABLE messages (
+        rowid INTEGER PRIMARY KEY,
+        message_rowid INTEGER,
+        thread TEXT,
+        room_name TEXT,
+        date REAL,
+        is_from_me INTEGER,
+        sender TEXT,
+        recipient TEXT,
+        service TEXT,
+        text TEXT,
+        body TEXT,
+        handles TEXT,
+        attachments TEXT,
+        source TEXT
+    );
+    CREATE VIRTUAL TABLE messages_fts USING fts5(
+        text, body, handles, attachments,
+        content='messages', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+    );
+"""
+INSERT_MESSAGE = "INSERT INTO messages VALUES ({})".format(", ".join("?" * 14))
+
+# what a search returns for every hit and context message
+RESULT_COLUMNS = """
+    m.rowid, m.thread, m.room_name, DATETIME(m.date, 'unixepoch', 'localtime'), m.sender, m.recipient,
+    m.service, COALESCE(m.text, m.body), m.attachments
+"""
+
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description="A tool to build and search a full-text index of the messages in a chat.db file")
+    parser.add_argument("-i", "--index", dest="index_path", required=True, help="Path to the index database, kept apart from the evidence")
+    parser.add_argument("-f", "--file", dest="database_path", help="Build the index from this chat.db file")
+    parser.add_argument("-q", "--query", dest="query", help="FTS5 query, e.g. lunch, \"see you tomorrow\", attachments:jpg, lunch NOT meeting")
+    parser.add_argument("-t", "--thread", dest="thread", help="Only search this thread")
+    parser.add_argument("-n", "--limit", dest="limit", type=int, default=50, help="Maximum number of hits (default: 50)")
+    parser.add_argument("-c", "--context", dest="context", type=int, default=2, help="Messages before and after each hit in its thread (default: 2)")
+    parser.add_argument("--by-date", dest="by_date", action="store_true", help="Order hits by date instead of relevance")
+    parser.add_argument("-o", "--output", dest="output_file", help="Save the hits as JSON instead of printing them")
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    if not args.database_path and not args.query:
+        parser.error("give -f to build the index, -q to search it, or both")
+    return args
+
+
+def decode_attributed_body(blob: bytes | None) -> str | None:
+    """
+    Recovers the plain text of a message.attributedBody blob, an NSAttributedString
+    in Apple's typedstream format. Newer macOS versions leave message.text NULL and
+    only keep the text here. The string follows the NSString class name, after a
+    '+' type marker, as a length (one byte, or 0x81/0x82 then 2/4 little-endian bytes)
+    and its UTF-8 bytes.
+    """
+    if not blob:
+        return None
+    start = blob.find(b"NSString")
+    if start == -1:
+        return None
+    start = blob.find(b"+", start + len(b"NSString"))
+    if start == -1 or start + 2 > len(blob):
+        return None
+    length = blob[start + 1]
+    start += 2
+    if length == 0x81:
+        length = int.from_bytes(blob[start:start + 2], "little")
+        start += 2
+    elif length == 0x82:
+        length = int.from_bytes(blob[start:start + 4], "little")
+        start += 4
+    return blob[start:start + length].decode("utf-8", errors="replace")
+
+
+def open_evidence(database_path) -> sqlite3.Connection:
+    # immutable, so SQLite never writes to the evidence or creates -wal/-shm files next to it
+    return sqlite3.connect(f"{pathlib.Path(database_path).resolve().as_uri()}?mode=ro&immutable=1", uri=True)
+
+
+def _index_rows(rows, participants, source):
+    for (rowid, thread, room_name, date, is_from_me, account, handle, service, text, attributed_body, attachments,
+         cache_roomnames) in rows:
+        body = decode_attributed_body(attributed_body)
+        if body == text:
+            body = None
+        sender = account if is_from_me else handle
+        recipient = handle if is_from_me else account
+        handles = [handle] if handle else []
+        # participants are keyed by the chat's room_name, which is the message's cache_roomnames
+        handles.extend(participant for participant, _ in participants.get(cache_roomnames, ()) if participant != handle)
+        yield (None, rowid, thread, room_name, date, is_from_me, sender, recipient, service, text, body,
+               " ".join(handles) or None, attachments, source)
+
+
+def build_index(database_path, index_path, batch_size=BATCH_SIZE, metrics=NO_METRICS) -> int:
+    """
+    Builds the full-text index of a chat.db file in a separate SQLite file.
+    chat.db is opened read-only. Messages are read and inserted in batches
+    of batch_size with executemany, then the FTS5 index is built from them
+    in one pass and optimised. Returns the number of messages indexed.
+    """
+    if os.path.exists(index_path) and os.path.samefile(database_path, index_path):
+        raise ValueError("the index must be a separate file from the evidence")
+
+    evidence = open_evidence(database_path)
+    index = sqlite3.connect(index_path)
+    total = 0
+    try:
+        cursor = evidence.cursor()
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(message)")}
+        query = MESSAGES_QUERY.format(cocoa_to_unix=COCOA_EPOCH_OFFSET,
+                                      attributed_body="m.attributedBody" if "attributedBody" in columns else "NULL")
+        with metrics.stage("query"):
+            participants = read_participants(cursor)
+            cursor.execute(query)
+
+        # the index can always be rebuilt from the evidence, so it isn't journaled
+        index.execute("PRAGMA journal_mode=OFF")
+        index.execute("PRAGMA synchronous=OFF")
+        index.executescript(INDEX_SCHEMA)
+        source = str(database_path)
+        with index:
+            while True:
+                with metrics.stage("query"):
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                with metrics.stage("insert"):
+                    index.executemany(INSERT_MESSAGE, _index_rows(rows, participants, source))
+                total += len(rows)
+                metrics.count("insert", rows=len(rows))
+
+        with metrics.stage("fts"), index:
+            index.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+            index.execute("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')")
+            index.execute("CREATE INDEX messages_thread_date_index ON messages (thread, date)")
+    finally:
+        evidence.close()
+        index.close()
+    return total
+
+
+def _message(row) -> dict:
+    return {
+        "Thread": row[1],
+        "RoomName": row[2],
+        "Date": row[3],
+        "From": row[4],
+        "To": row[5],
+        "Service": row[6],
+        "Message": row[7],
+        "Attachments": row[8].split("\n") if row[8] else None,
+    }
+
+
+def search_index(index_path, query, thread=None, limit=50, context=2, by_date=False, metrics=NO_METRICS) -> list[dict]:
+    """
+    Runs an FTS5 query (keywords, "phrases", column:term, AND/OR/NOT, prefix*)
+    against an index built by build_index. Each hit carries its thread, date,
+    a highlighted snippet and up to context messages before and after it in
+    the same thread. Hits are ordered by relevance (bm25), or by date.
+    """
+    index = sqlite3.connect(f"{pathlib.Path(index_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        sql = f"""
+            SELECT {RESULT_COLUMNS}, m.date,
+                snippet(messages_fts, -1, '[', ']', '...', 12)
+            FROM messages_fts
+            JOIN messages AS m ON m.rowid = messages_fts.rowid
+            WHERE messages_fts MATCH ?
+        """
+        parameters = [query]
+        if thread:
+            sql += " AND m.thread = ?"
+            parameters.append(thread)
+        sql += " ORDER BY m.date" if by_date else " ORDER BY rank"
+        sql += " LIMIT ?"
+        parameters.append(limit)
+        with metrics.stage("search"):
+            hits = index.execute(sql, parameters).fetchall()
+        metrics.count("search", hits=len(hits))
+
+        results = []
+        with metrics.stage("context"):
+            for hit in hits:
+                result = _message(hit)
+                result["Snippet"] = hit[10]
+                if context:
+                    # the same (thread, date) order as the index, ties broken by rowid
+                    before = index.execute(f"""
+                        SELECT {RESULT_COLUMNS} FROM messages AS m
+                        WHERE m.thread IS ? AND (m.date < ? OR (m.date = ? AND m.rowid < ?))
+                        ORDER BY m.date DESC, m.rowid DESC LIMIT ?
+                    """, (hit[1], hit[9], hit[9], hit[0], context)).fetchall()
+                    after = index.execute(f"""
+                        SELECT {RESULT_COLUMNS} FROM messages AS m
+                        WHERE m.thread IS ? AND (m.date > ? OR (m.date = ? AND m.rowid > ?))
+                        ORDER BY m.date, m.rowid LIMIT ?
+                    """, (hit[1], hit[9], hit[9], hit[0], context)).fetchall()
+                    result["Before"] = [_message(row) for row in reversed(before)]
+                    result["After"] = [_message(row) for row in after]
+                results.append(result)
+    finally:
+        index.close()
+    return results
+
+
+def print_results(results):
+    for result in results:
+        print(f"== {result['Date']}  {result['Thread']}")
+        for message in result.get("Before", []):
+            print(f"   {message['Date']}  {message['From']}: {message['Message']}")
+        # attachment names are stored one per line
+        snippet = result["Snippet"].replace("\n", ", ")
+        print(f" > {result['Date']}  {result['From']}: {snippet}")
+        for message in result.get("After", []):
+            print(f"   {message['Date']}  {message['From']}: {message['Message']}")
+        print()
+    print(f"{len(results)} hits")
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    with Metrics.from_args("message_index", args) as metrics:
+        try:
+            if args.database_path:
+                total = build_index(args.database_path, args.index_path, metrics=metrics)
+                print(f"{total} messages indexed into {args.index_path}")
+            if args.query:
+                results = search_index(args.index_path, args.query, args.thread, args.limit, args.context,
+                                       args.by_date, metrics)
+                if args.output_file:
+                    with open(args.output_file, "w") as f:
+                        json.dump(results, f, indent=4)
+                    print(f"{len(results)} hits saved to {args.output_file}")
+                else:
+                    print_results(results)
+        except sqlite3.Error as e:
+            print("SQLite error:", e)
+            sys.exit(1)
+        except ValueError as e:
+            print("Error:", e)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+__description__ = "Reads the participants of every group chat in a chat.db file, shared by iMessageQuery and message_index"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+PARTICIPANTS_QUERY = """
+    SELECT c.room_name, h.id, h.service
+    FROM chat AS c
+    JOIN chat_handle_join AS ch ON ch.chat_id = c.rowid
+    JOIN handle AS h ON h.rowid = ch.handle_id
+    WHERE c.room_name IS NOT NULL
+"""
+
+
+def read_participants(cursor) -> dict[str, list[tuple[str, str]]]:
+    """
+    Maps each group chat's room name to its participants' (handle, service) pairs.
+    Read once, so group messages don't need a row per participant.
+    """
+    participants = {}
+    for room_name, handle, service in cursor.execute(PARTICIPANTS_QUERY).fetchall():
+        participants.setdefault(room_name, []).append((handle, service))
+    return participants
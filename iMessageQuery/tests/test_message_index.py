@@ -0,0 +1,68 @@
+import sys
+import pathlib
+import sqlite3
+import tempfile
+import unittest
+
+# message_index lives one folder up, in iMessageQuery
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+from message_index import build_index, search_index
+
+CHAT_SCHEMA = """
+    CREATE TABLE handle (ROWID INTEGER PRIMARY KEY, id TEXT NOT NULL, service TEXT NOT NULL);
+    CREATE TABLE chat (ROWID INTEGER PRIMARY KEY, room_name TEXT, display_name TEXT);
+    CREATE TABLE chat_handle_join (chat_id INTEGER, handle_id INTEGER);
+    CREATE TABLE message (ROWID INTEGER PRIMARY KEY, text TEXT, handle_id INTEGER, service TEXT, account TEXT,
+                          date INTEGER, is_from_me INTEGER, cache_roomnames TEXT);
+    CREATE TABLE attachment (ROWID INTEGER PRIMARY KEY, filename TEXT, transfer_name TEXT);
+    CREATE TABLE message_attachment_join (message_id INTEGER, attachment_id INTEGER);
+"""
+
+
+class GroupParticipantTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        folder = pathlib.Path(self.directory.name)
+        self.database_path = folder / "chat.db"
+        self.index_path = folder / "index.db"
+        connection = sqlite3.connect(self.database_path)
+        connection.executescript(CHAT_SCHEMA)
+        connection.executemany("INSERT INTO handle VALUES (?, ?, 'iMessage')",
+                               [(1, "+15550000001"), (2, "+15550000002"), (3, "+15550000003")])
+        # the display name differs from the room name, as it does on a real device
+        connection.execute("INSERT INTO chat VALUES (1, 'chat1', 'Weekend plans')")
+        connection.executemany("INSERT INTO chat_handle_join VALUES (1, ?)", [(1,), (2,), (3,)])
+        connection.executemany("INSERT INTO message VALUES (?, ?, ?, 'iMessage', 'e:owner@example.com', ?, ?, ?)", [
+            (1, "lunch on saturday", 1, 700000000000000000, 0, "chat1"),
+            (2, "see you there", 0, 700000060000000000, 1, "chat1"),
+            (3, "direct message", 2, 700000120000000000, 0, None),
+        ])
+        connection.commit()
+        connection.close()
+        build_index(self.database_path, self.index_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_group_message_is_found_by_a_participant(self):
+        # +15550000003 never sent anything, it is only a member of chat1
+        results = search_index(self.index_path, 'handles:"15550000003"', context=0)
+        self.assertEqual(sorted(result["Message"] for result in results), ["lunch on saturday", "see you there"])
+
+    def test_sender_is_not_repeated_as_a_participant(self):
+        index = sqlite3.connect(self.index_path)
+        handles = index.execute("SELECT handles FROM messages WHERE message_rowid = 1").fetchone()[0]
+        index.close()
+        self.assertEqual(handles.split(), ["+15550000001", "+15550000002", "+15550000003"])
+
+    def test_direct_message_only_has_its_handle(self):
+        results = search_index(self.index_path, 'handles:"15550000002"', context=0)
+        self.assertEqual(sorted(result["Message"] for result in results),
+                         ["direct message", "lunch on saturday", "see you there"])
+        results = search_index(self.index_path, 'handles:"15550000001"', context=0)
+        self.assertNotIn("direct message", [result["Message"] for result in results])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,13 +3,72 @@ import json
 from argparse import ArgumentParser
 import os
 import re
-
-
-def parse_arguments():
+import sys
+import pathlib
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "parsing_tools"))
+from case_store import CaseStore
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
+from cocoa_time import COCOA_EPOCH_OFFSET, parse_time_argument, to_cocoa_time
+
+# A list of streams to iterate through
+STREAM_NAMES = [
+    "/portrait/topic",
+    "/portrait/entity",
+    "/notification/usage",
+    "/app/intents",
+    "/app/mediaUsage",
+    "/app/usage",
+    "/app/webUsage",
+    "/device/isLocked",
+    "/discoverability/signals",
+    "/display/isBacklit",
+    "/event/tombstone"
+]
+
+
+def parse_arguments(argv=None):
     parser = ArgumentParser(description="A tool to extract artifacts from a knowledgeC.db file")
     parser.add_argument("-f", "--file", dest="database_path", required=True, help="Path to the knowledgeC.db file")
     parser.add_argument("-o", "--output-dir", dest="output_dir", help="Path to the output directory")
-    return parser.parse_args()
+    parser.add_argument("--start", dest="start", type=parse_time_argument,
+                        help="Only include entries starting at or after this local time (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("--end", dest="end", type=parse_time_argument,
+                        help="Only include entries starting before this local time (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("-s", "--stream", dest="streams", action="append", choices=STREAM_NAMES,
+                        help="Stream to export, can be given multiple times (default: all streams)")
+    parser.add_argument("-b", "--bundle-id", dest="bundle_ids", action="append",
+                        help="Only include entries for this ZBUNDLEID, can be given multiple times")
+    parser.add_argument("--case-db", dest="case_db", help="Also load the entries into this case SQLite database")
+    parser.add_argument("--analytics", dest="analytics", action="store_true",
+                        help="Write per-app and screen time usage summaries of /app/usage instead of exporting the streams")
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.analytics and (args.streams or args.case_db):
+        parser.error("--analytics only summarises /app/usage, it can't be combined with -s or --case-db")
+    return args
+
+
+def build_filters(start=None, end=None, bundle_ids=None, bundle_column="ZSOURCE.ZBUNDLEID"):
+    """
+    Builds the extra WHERE conditions and their parameters.
+    Time bounds are compared against the raw ZSTARTDATE value
+    so SQLite can use the index instead of formatting every row.
+    Bundle IDs are matched against bundle_column.
+    """
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("ZOBJECT.ZSTARTDATE >= ?")
+        params.append(to_cocoa_time(start))
+    if end is not None:
+        conditions.append("ZOBJECT.ZSTARTDATE < ?")
+        params.append(to_cocoa_time(end))
+    if bundle_ids:
+        placeholders = ", ".join("?" for _ in bundle_ids)
+        conditions.append(f"{bundle_column} IN ({placeholders})")
+        params.extend(bundle_ids)
+    return conditions, params
 
 
 def extract_readable_text(input_str):
@@ -25,27 +84,18 @@ def extract_readable_text(input_str):
     return readable_text
 
 
-def run_sqlite_query(database_path, output_dir):
+def run_sqlite_query(database_path, output_dir, start=None, end=None, streams=None, bundle_ids=None, case_db=None,
+                     metrics=NO_METRICS):
+    connection = None
+    case_store = CaseStore(case_db) if case_db else None
     try:
         connection = sqlite3.connect(database_path)
         cursor = connection.cursor()
 
-        # A list of streams to iterate through
-        stream_names = [
-            "/portrait/topic",
-            "/portrait/entity",
-            "/notification/usage",
-            "/app/intents",
-            "/app/mediaUsage",
-            "/app/usage",
-            "/app/webUsage",
-            "/device/isLocked",
-            "/discoverability/signals",
-            "/display/isBacklit",
-            "/event/tombstone"
-        ]
-
-        for stream_name in stream_names:
+        conditions, filter_params = build_filters(start, end, bundle_ids)
+        where_clause = " AND ".join(["ZSTREAMNAME = ?"] + conditions)
+
+        for stream_name in streams or STREAM_NAMES:
             query = f"""
                 SELECT
                     datetime(ZOBJECT.ZCREATIONDATE + 978307200, 'UNIXEPOCH', 'LOCALTIME') as "ENTRY CREATION", 
@@ -74,44 +124,63 @@ def run_sqlite_query(database_path, output_dir):
                     ZSTRUCTUREDMETADATA.Z_DKDIGITALHEALTHMETADATAKEY__WEBPAGEURL as "WEB URL",
                     ZSOURCE.ZBUNDLEID,
                     ZSOURCE.ZGROUPID,
-                    ZSOURCE.ZITEMID
+                    ZSOURCE.ZITEMID,
+                    ZOBJECT.ZSTARTDATE + {COCOA_EPOCH_OFFSET} as "START EPOCH",
+                    ZOBJECT.ZENDDATE + {COCOA_EPOCH_OFFSET} as "END EPOCH"
                 FROM ZOBJECT
                 LEFT JOIN ZSTRUCTUREDMETADATA on ZOBJECT.ZSTRUCTUREDMETADATA = ZSTRUCTUREDMETADATA.Z_PK
                 LEFT JOIN ZSOURCE on ZOBJECT.ZSOURCE = ZSOURCE.Z_PK 
-                WHERE ZSTREAMNAME = ?
-                ORDER BY "START"
+                WHERE {where_clause}
+                ORDER BY ZOBJECT.ZSTARTDATE
             """
 
-            cursor.execute(query, (stream_name,))
+            with metrics.stage("query"):
+                cursor.execute(query, (stream_name, *filter_params))
 
-            rows = cursor.fetchall()
+                rows = cursor.fetchall()
+            metrics.count("query", rows=len(rows))
 
             columns = [desc[0] for desc in cursor.description]
 
             result_list = []
             for row in rows:
-                result_dict = {}
-                has_null = False
-                for i in range(len(columns)):
-                    value = row[i]
-                    if value is None:
-                        has_null = True
-                        continue
-                    # This will extract any blob values decode them and extract the strings
-                    if isinstance(value, bytes):
-                        value = value.decode('utf-8', errors='replace')
-                    if isinstance(value, str):
-                        value = extract_readable_text(value)
-                    result_dict[columns[i]] = value
-                result_list.append(result_dict)
+                with metrics.stage("convert"):
+                    result_dict = {}
+                    has_null = False
+                    for i in range(len(columns)):
+                        value = row[i]
+                        if value is None:
+                            has_null = True
+                            continue
+                        # This will extract any blob values decode them and extract the strings
+                        if isinstance(value, bytes):
+                            value = value.decode('utf-8', errors='replace')
+                        if isinstance(value, str):
+                            value = extract_readable_text(value)
+                        result_dict[columns[i]] = value
+                    result_list.append(result_dict)
+
+                if case_store:
+                    with metrics.stage("case_db"):
+                        case_store.add("knowledgec", {
+                            "timestamp": result_dict.get("START EPOCH"),
+                            "end_timestamp": result_dict.get("END EPOCH"),
+                            "stream": stream_name,
+                            "bundle_id": result_dict.get("ZBUNDLEID"),
+                            "value": result_dict.get("ZVALUESTRING"),
+                            "source": str(database_path),
+                            "record": result_dict
+                        })
 
             output_file = f"output_{stream_name.replace('/', '_').replace(' ', '_').lower()}.json"
             if output_dir:
                 output_file = os.path.join(output_dir, output_file)
 
             # Dump the list into a JSON file
-            with open(output_file, "w") as json_file:
-                json.dump(result_list, json_file, indent=4)
+            with metrics.stage("write"):
+                with open(output_file, "w") as json_file:
+                    json.dump(result_list, json_file, indent=4)
+                    metrics.count("write", records=len(result_list), bytes=json_file.tell())
 
             print(f"Query results for stream '{stream_name}' have been saved to:", output_file)
 
@@ -122,13 +191,37 @@ def run_sqlite_query(database_path, output_dir):
     finally:
         if connection:
             connection.close()
+        if case_store:
+            with metrics.stage("case_db"):
+                case_store.close()
+            print("Entries have been loaded into:", case_db)
 
 
-# Main function
-def main():
-    args = parse_arguments()
+def run_usage_analytics(database_path, output_dir, start=None, end=None, bundle_ids=None, metrics=NO_METRICS):
+    # imported here so the export doesn't load it
+    from usage_analytics import BUNDLE_ID, write_usage_summaries
+    connection = None
+    try:
+        connection = sqlite3.connect(database_path)
+        conditions, filter_params = build_filters(start, end, bundle_ids, BUNDLE_ID)
+        write_usage_summaries(connection, output_dir, conditions, filter_params, metrics)
+    except sqlite3.Error as e:
+        print("SQLite error:", e)
+    finally:
+        if connection:
+            connection.close()
+
 
-    run_sqlite_query(args.database_path, args.output_dir)
+# Main function
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    with Metrics.from_args("knowledgeC", args) as metrics:
+        if args.analytics:
+            run_usage_analytics(args.database_path, args.output_dir, args.start, args.end, args.bundle_ids, metrics)
+            return
+        run_sqlite_query(args.database_path, args.output_dir, start=args.start, end=args.end,
+                         streams=args.streams, bundle_ids=args.bundle_ids, case_db=args.case_db, metrics=metrics)
 
 
 if __name__ == "__main__":
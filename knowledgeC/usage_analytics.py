@@ -0,0 +1,148 @@
+import os
+import json
+
+# only imported by knowledgeC.py, which puts parsing_tools on the path
+from metrics import NO_METRICS
+from cocoa_time import COCOA_EPOCH_OFFSET
+
+__description__ = "Per-app and per-device usage summaries of the knowledgeC /app/usage stream, computed inside SQLite"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# Times are shifted to local "wall clock" seconds, so hours and days are cut at local midnight
+# like the START/END columns of the export.
+LOCAL_SECONDS = "({column} + {offset} + (strftime('%s', CAST({column} + {offset} AS INTEGER), 'unixepoch', 'localtime') - CAST({column} + {offset} AS INTEGER)))"
+# The bundle is in ZVALUESTRING for /app/usage, -b filters on this too so it matches the reported bundle
+BUNDLE_ID = "COALESCE(ZOBJECT.ZVALUESTRING, ZSOURCE.ZBUNDLEID)"
+USAGE_INTERVALS = """
+    CREATE TEMP TABLE usage_intervals AS
+    SELECT {bundle_id} AS bundle_id, {start} AS start, {end} AS end
+    FROM ZOBJECT
+    LEFT JOIN ZSOURCE ON ZOBJECT.ZSOURCE = ZSOURCE.Z_PK
+    WHERE {where_clause} AND ZOBJECT.ZENDDATE > ZOBJECT.ZSTARTDATE
+"""
+
+# Overlapping or touching intervals of the same bundle are merged into one session:
+# an interval starts a new session when it begins after every earlier interval has ended.
+# With NULL as the bundle column the app sessions are merged together into device screen time.
+MERGE_SESSIONS = """
+    CREATE TEMP TABLE {table} AS
+    SELECT bundle_id, MIN(start) AS start, MAX(end) AS end, COUNT(*) AS records
+    FROM (
+        SELECT *, SUM(new_session) OVER (PARTITION BY bundle_id ORDER BY start, end ROWS UNBOUNDED PRECEDING) AS session
+        FROM (
+            SELECT bundle_id, start, end,
+                CASE WHEN start <= MAX(end) OVER (
+                    PARTITION BY bundle_id ORDER BY start, end ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                ) THEN 0 ELSE 1 END AS new_session
+            FROM (SELECT {bundle_column} AS bundle_id, start, end FROM {source})
+        )
+    )
+    GROUP BY bundle_id, session
+"""
+
+# Sessions are cut at hour boundaries so every second is counted in the hour it happened
+SPLIT_HOURS = """
+    CREATE TEMP TABLE {table}_hours AS
+    WITH RECURSIVE hours(bundle_id, start, end, hour, first) AS (
+        SELECT bundle_id, start, end, CAST(start AS INTEGER) - CAST(start AS INTEGER) % 3600, 1 FROM {table}
+        UNION ALL
+        SELECT bundle_id, start, end, hour + 3600, 0 FROM hours WHERE hour + 3600 < end
+    )
+    SELECT bundle_id, hour, MIN(end, hour + 3600) - MAX(start, hour) AS seconds, first FROM hours
+"""
+
+BY_DAY = """
+    SELECT bundle_id, date(hour, 'unixepoch') AS day, ROUND(SUM(seconds), 3), SUM(first)
+    FROM {table}_hours
+    GROUP BY bundle_id, day
+    ORDER BY bundle_id, day
+"""
+
+BY_HOUR = """
+    SELECT bundle_id, date(hour, 'unixepoch') AS day, CAST(strftime('%H', hour, 'unixepoch') AS INTEGER),
+        ROUND(SUM(seconds), 3), SUM(first)
+    FROM {table}_hours
+    GROUP BY bundle_id, hour
+    ORDER BY bundle_id, hour
+"""
+
+TOTALS = """
+    SELECT bundle_id, ROUND(SUM(end - start), 3), COUNT(*), SUM(records),
+        datetime(MIN(start), 'unixepoch'), datetime(MAX(end), 'unixepoch')
+    FROM {table}
+    GROUP BY bundle_id
+    ORDER BY SUM(end - start) DESC
+"""
+
+
+def _write(output_dir, name, rows, metrics=NO_METRICS):
+    output_file = f"output_{name}.json"
+    if output_dir:
+        output_file = os.path.join(output_dir, output_file)
+    with metrics.stage("write"):
+        with open(output_file, "w") as json_file:
+            json.dump(rows, json_file, indent=4)
+            metrics.count("write", records=len(rows), bytes=json_file.tell())
+    print(f"Usage summary '{name}' has been saved to:", output_file)
+    return output_file
+
+
+def summarize_usage(connection, conditions=(), params=(), stream_name="/app/usage", metrics=NO_METRICS) -> dict[str, list[dict]]:
+    """
+    Aggregates a usage stream inside SQLite, without exporting its rows.
+    conditions and params are the extra WHERE conditions from build_filters,
+    with BUNDLE_ID as the bundle column.
+    Overlapping records of an app are merged into sessions before anything is
+    summed, and for the device screen time the records of every app are
+    merged together. Returns the summary tables by name:
+    app_totals, app_usage_by_day, app_usage_by_hour, screen_time_by_day
+    and screen_time_by_hour. Days and hours are local time.
+    """
+    where_clause = " AND ".join(["ZSTREAMNAME = ?"] + list(conditions))
+    cursor = connection.cursor()
+    with metrics.stage("query"):
+        cursor.execute("DROP TABLE IF EXISTS temp.usage_intervals")
+        start = LOCAL_SECONDS.format(column="ZOBJECT.ZSTARTDATE", offset=COCOA_EPOCH_OFFSET)
+        end = LOCAL_SECONDS.format(column="ZOBJECT.ZENDDATE", offset=COCOA_EPOCH_OFFSET)
+        cursor.execute(USAGE_INTERVALS.format(bundle_id=BUNDLE_ID, start=start, end=end, where_clause=where_clause), (stream_name, *params))
+        for table, source, bundle_column in [("app_sessions", "usage_intervals", "bundle_id"),
+                                             ("screen_sessions", "app_sessions", "NULL")]:
+            cursor.execute(f"DROP TABLE IF EXISTS temp.{table}")
+            cursor.execute(f"DROP TABLE IF EXISTS temp.{table}_hours")
+            cursor.execute(MERGE_SESSIONS.format(table=table, source=source, bundle_column=bundle_column))
+            cursor.execute(SPLIT_HOURS.format(table=table))
+        metrics.count("query", rows=cursor.execute("SELECT COUNT(*) FROM usage_intervals").fetchone()[0])
+
+    summaries = {}
+    with metrics.stage("aggregate"):
+        summaries["app_totals"] = [
+            {"ZBUNDLEID": bundle_id, "USAGE IN SECONDS": seconds, "SESSIONS": sessions, "RECORDS": records,
+             "FIRST USE": first_use, "LAST USE": last_use}
+            for bundle_id, seconds, sessions, records, first_use, last_use in cursor.execute(TOTALS.format(table="app_sessions"))
+        ]
+        summaries["app_usage_by_day"] = [
+            {"ZBUNDLEID": bundle_id, "DAY": day, "USAGE IN SECONDS": seconds, "SESSIONS": sessions}
+            for bundle_id, day, seconds, sessions in cursor.execute(BY_DAY.format(table="app_sessions"))
+        ]
+        summaries["app_usage_by_hour"] = [
+            {"ZBUNDLEID": bundle_id, "DAY": day, "HOUR": hour, "USAGE IN SECONDS": seconds, "SESSIONS": sessions}
+            for bundle_id, day, hour, seconds, sessions in cursor.execute(BY_HOUR.format(table="app_sessions"))
+        ]
+        summaries["screen_time_by_day"] = [
+            {"DAY": day, "USAGE IN SECONDS": seconds, "SESSIONS": sessions}
+            for _, day, seconds, sessions in cursor.execute(BY_DAY.format(table="screen_sessions"))
+        ]
+        summaries["screen_time_by_hour"] = [
+            {"DAY": day, "HOUR": hour, "USAGE IN SECONDS": seconds, "SESSIONS": sessions}
+            for _, day, hour, seconds, sessions in cursor.execute(BY_HOUR.format(table="screen_sessions"))
+        ]
+        for table in ["usage_intervals", "app_sessions", "app_sessions_hours", "screen_sessions", "screen_sessions_hours"]:
+            cursor.execute(f"DROP TABLE temp.{table}")
+    return summaries
+
+
+def write_usage_summaries(connection, output_dir, conditions=(), params=(), metrics=NO_METRICS) -> list[str]:
+    """Writes every summary of summarize_usage to output_<name>.json. Returns the files written."""
+    summaries = summarize_usage(connection, conditions, params, metrics=metrics)
+    return [_write(output_dir, name, rows, metrics) for name, rows in summaries.items()]
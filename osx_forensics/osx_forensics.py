@@ -0,0 +1,77 @@
+import sys
+import time
+import pathlib
+import importlib
+
+__description__ = "One command for every tool in this repository, each tool is only imported when its subcommand runs"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# subcommand: (folder, module, what it does), every module has a main(argv)
+COMMANDS = {
+    "scrape": ("file_scraper", "file_scraper", "Find files of a type in a directory or archive, optionally deduplicated"),
+    "plist": ("plist_parser", "plist_parser", "Print a binary or XML plist as a readable data structure"),
+    "segb": ("segb_parser", "segb_parser", "Parse a SEGB file or a Biome streams directory"),
+    "cookies": ("parsing_tools", "bcf_parser", "Parse or merge Cookies.binarycookies files"),
+    "imessage": ("iMessageQuery", "iMessageQuery", "Export the messages in an iMessage chat.db"),
+    "imessage-index": ("iMessageQuery", "message_index", "Build or search a full-text index of an iMessage chat.db"),
+    "knowledgec": ("knowledgeC", "knowledgeC", "Run the knowledgeC.db queries"),
+    "timeline": ("timeline", "timeline", "Merge tool outputs into one sorted timeline"),
+    "triage": ("archive_triage", "archive_triage", "Parse the artifacts inside a tar or zip archive"),
+}
+
+
+def print_usage(file=sys.stdout):
+    print("usage: osx_forensics.py [--import-time] <command> [options]", file=file)
+    print(file=file)
+    print("commands:", file=file)
+    for command, (_, _, help_text) in COMMANDS.items():
+        print(f"  {command:<16}{help_text}", file=file)
+    print(file=file)
+    print("Run 'osx_forensics.py <command> -h' for the options of a command.", file=file)
+    print("--import-time reports how long the command took to import and to run on stderr.", file=file)
+
+
+def load_command(command):
+    """Imports the module behind a subcommand. Returns the module and the seconds the import took."""
+    folder, module_name, _ = COMMANDS[command]
+    # the tools find parsing_tools themselves, only their own folder is needed
+    sys.path.append(str(REPO_ROOT / folder))
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    return module, time.perf_counter() - started
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    report_import_time = False
+    if argv and argv[0] == "--import-time":
+        report_import_time = True
+        argv = argv[1:]
+
+    if not argv or argv[0] in ("-h", "--help"):
+        print_usage()
+        sys.exit(0 if argv else 1)
+    command, command_argv = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"osx_forensics.py: unknown command '{command}'", file=sys.stderr)
+        print_usage(sys.stderr)
+        sys.exit(2)
+
+    module, import_seconds = load_command(command)
+    # usage and error messages of the tool name the subcommand
+    sys.argv = [f"osx_forensics.py {command}"] + command_argv
+    started = time.perf_counter()
+    try:
+        module.main(command_argv)
+    finally:
+        if report_import_time:
+            run_seconds = time.perf_counter() - started
+            print(f"{command}: imported {COMMANDS[command][1]} in {import_seconds * 1000:.1f} ms, "
+                  f"ran in {run_seconds * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
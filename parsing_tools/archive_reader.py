@@ -0,0 +1,128 @@
+import os
+import mmap
+import shutil
+import typing
+import tarfile
+import zipfile
+import datetime
+import tempfile
+import contextlib
+import dataclasses
+
+__description__ = "Reads the members of tar and zip collection archives in one sequential pass, without extracting them"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# Members up to this size are read into memory, bigger ones are spooled to a temporary file and memory-mapped
+MEMORY_LIMIT = 64 << 20
+COPY_BUFFER_SIZE = 1 << 20
+# enough of the start of a member to recognise every artifact type, SEGB v1 keeps its magic at offset 52
+HEADER_SIZE = 56
+
+SIGNATURES = [
+    (b"SQLite format 3\x00", "sqlite"),
+    (b"bplist00", "plist"),
+    (b"cook", "cookies"),
+    (b"SEGB", "segb"),
+]
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class ArchiveMember:
+    name: str
+    size: int
+    # offset of the member's data in the archive (for zip, of its local header)
+    offset: int
+    mtime: float | None
+
+
+def iter_archive(path) -> typing.Iterator[tuple[ArchiveMember, typing.BinaryIO]]:
+    """
+    Yields every regular file in a tar (optionally compressed) or zip archive
+    with a file object streaming its contents. The archive is read front to
+    back exactly once: tar archives are opened in stream mode and zip members
+    are visited in the order they are stored. Each file object is only valid
+    until the next member is yielded.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in sorted(archive.infolist(), key=lambda info: info.header_offset):
+                if info.is_dir():
+                    continue
+                member = ArchiveMember(info.filename, info.file_size, info.header_offset,
+                                       _zip_mtime(info))
+                with archive.open(info) as fileobj:
+                    yield member, fileobj
+        return
+
+    with tarfile.open(path, mode="r|*") as archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            yield ArchiveMember(info.name, info.size, info.offset_data, info.mtime), archive.extractfile(info)
+
+
+def _zip_mtime(info: zipfile.ZipInfo) -> float | None:
+    try:
+        return datetime.datetime(*info.date_time).timestamp()
+    except ValueError:
+        return None
+
+
+def list_archive_members(path) -> list[ArchiveMember]:
+    """Lists the regular files in an archive with their sizes and offsets."""
+    return [member for member, _ in iter_archive(path)]
+
+
+def identify_artifact(header: bytes) -> str | None:
+    """Names the artifact type ("segb", "cookies", "plist", "sqlite") from the first bytes of a file."""
+    for signature, artifact_type in SIGNATURES:
+        if header.startswith(signature):
+            return artifact_type
+    if header[52:56] == b"SEGB":
+        return "segb"
+    return None
+
+
+@contextlib.contextmanager
+def member_buffer(fileobj: typing.BinaryIO, size: int, header: bytes = b"",
+                  memory_limit: int = MEMORY_LIMIT) -> typing.Iterator[bytes | mmap.mmap]:
+    """
+    Gives the contents of a member as one buffer for the buffer based parsers.
+    header is whatever was already read from fileobj. Small members come back
+    as bytes, large ones are spooled to a temporary file and memory-mapped.
+    """
+    if size <= memory_limit:
+        yield header + fileobj.read()
+        return
+    with tempfile.TemporaryFile() as spool:
+        spool.write(header)
+        shutil.copyfileobj(fileobj, spool, COPY_BUFFER_SIZE)
+        spool.flush()
+        if spool.tell() == 0:
+            yield b""
+            return
+        data = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield data
+        finally:
+            try:
+                data.close()
+            except BufferError:
+                # parsed records still reference the mapping, it is released once they are gone
+                pass
+
+
+def spool_member(fileobj: typing.BinaryIO, destination, header: bytes = b"") -> str:
+    """Copies a member to a file, for tools such as SQLite that need a real path. Returns the path."""
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    with open(destination, "wb") as f:
+        f.write(header)
+        shutil.copyfileobj(fileobj, f, COPY_BUFFER_SIZE)
+    return str(destination)
+
+
+def safe_member_path(name: str) -> str:
+    """Turns a member name into a relative path that cannot leave the directory it is joined to."""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    return os.path.join(*parts) if parts else "member"
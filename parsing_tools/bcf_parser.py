@@ -4,10 +4,14 @@ import pathlib
 import sys
 import json
 import struct
-from io import BytesIO
-from time import strftime, gmtime
-import io
-from typing import Union, BinaryIO
+import mmap
+import csv
+import contextlib
+import typing
+import datetime
+
+from binary_reader import BinaryReader
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
 
 
 __description__ = "Extracts and parses data from Google Chrome Cookies.binarycookies files"
@@ -15,222 +19,314 @@ __organization__ = "Omen-Cyber"
 __contact__ = "DaKota LaFeber"
 
 
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(description="A tool to extract and parse data from Google Chrome Cookies.binarycookies files")
-    parser.add_argument('-i', type=str, required=True, help='Path to Cookies.binarycookies file')
+    parser.add_argument('-i', type=str, nargs='+', default=[], help='Path to one or more Cookies.binarycookies files')
+    parser.add_argument('-d', type=str, action='append', default=[], help='Directory to search for *.binarycookies files, can be given multiple times')
     parser.add_argument('-o', type=str, required=True, help='Path to save output file')
-    parser.add_argument('-f', choices=['json'], required=False, help='Output format: json')
-    return parser.parse_args()
-
+    parser.add_argument('-f', choices=['json', 'ndjson', 'csv', 'txt', 'sqlite'], required=False,
+                        help='Output format: json, ndjson, csv or txt (default) for a single file, ndjson (default) or sqlite when merging several files')
+    parser.add_argument('-w', type=int, help='Number of worker processes when merging several files (default: CPU count)')
+    parser.add_argument('--case-db', dest='case_db', help='Also load the cookies into this case SQLite database')
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    if not args.i and not args.d:
+        parser.error("one of -i or -d is required")
+    if (len(args.i) > 1 or args.d) and args.f not in (None, 'ndjson', 'sqlite'):
+        parser.error("several files can only be merged into ndjson or sqlite")
+    return args
 
-class Magic:
-    _Magic = 0x6b6f6f63  # 'cook'
 
+# Output files are written through a 1 MiB buffer
+WRITE_BUFFER_SIZE = 1 << 20
 
-class BinaryReader:
-    def __init__(self, stream: Union[BinaryIO, bytes]):
-        self.b_stream = io.BytesIO(stream) if isinstance(stream, bytes) else stream
 
-    def seek(self, offset, whence=io.SEEK_SET):
-        return self.b_stream.seek(offset, whence)
-
-    def tell(self):
-        return self.b_stream.tell()
+class Magic:
+    _Magic = 0x6b6f6f63  # 'cook'
 
-    def read_raw(self, count):
-        result = self.b_stream.read(count)
-        if len(result) != count:
-            raise ValueError(f"Could not read expected bytes: {count}, got {len(result)} for {result}")
-        return result
 
-    def read_int32(self) -> int:
-        return struct.unpack(">i", self.read_raw(4))[0]
-    
-    def read2_int32(self) -> int:
-        raw = self.read_raw(4)
-        return struct.unpack("<i", raw)[0]
+# precompiled layouts, the file header is big-endian while pages and cookies are little-endian
+FILE_HEADER = struct.Struct(">4si")
+PAGE_HEADER = struct.Struct("<ii")
+# size, unknown, flags, port count, url/name/path/value/comment/comment URL offsets, expiry, creation
+COOKIE_HEADER = struct.Struct("<iiii6i2d")
+COOKIE_FLAGS = {
+    0x1: 'Secure',
+    0x4: 'HttpOnly'
+}
+COCOA_EPOCH = datetime.datetime(2001, 1, 1, tzinfo=datetime.timezone.utc)
 
-    def read_uint32(self) -> int:
-        """
-        Reads an unsigned 32-bit integer from the binary stream.
-        
-        Returns:
-            int: The unsigned 32-bit integer read from the stream.
-        """
-        return struct.unpack("<I", self.read_raw(4))[0] 
 
-    def read_uint64(self) -> int:
-        return struct.unpack("<Q", self.read_raw(8))[0]
+# Names every set flag bit, bits without a known meaning are kept as hex
+def describe_cookie_flags(flags: int) -> str:
+    names = []
+    bit = 1
+    while bit <= flags:
+        if flags & bit:
+            names.append(COOKIE_FLAGS.get(bit, f'Unknown (0x{bit:x})'))
+        bit <<= 1
+    return '; '.join(names)
 
-    def read_datetime(self) -> str:
-        """Reads and converts binary cookie date."""
-        epoch = struct.unpack('<d', self.read_raw(8))[0] + 978307200
-        return strftime("%a, %d %b %Y", gmtime(epoch))
 
-    def read_offsets(self) -> tuple:
-        """Reads the offsets for URL, name, path, and value."""
-        return struct.unpack('<iiii', self.read_raw(16))
+# Converts a raw binary cookie date to an ISO 8601 UTC time, keeping fractions of a second
+def format_cookie_date(cocoa_time: float) -> str:
+    try:
+        return (COCOA_EPOCH + datetime.timedelta(seconds=cocoa_time)).isoformat()
+    except (OverflowError, ValueError):
+        return str(cocoa_time)
+
+
+# Cookies keep raw Cocoa times, this formats them for the text based outputs
+def format_cookie(cookie: dict) -> dict:
+    return {**cookie, 'created': format_cookie_date(cookie['created']), 'expires': format_cookie_date(cookie['expires'])}
+
+
+# The row loaded into the case database for one cookie, times become seconds since the Unix epoch
+def cookie_case_row(cookie: dict, source: str) -> dict:
+    cocoa_offset = COCOA_EPOCH.timestamp()
+    return {
+        'timestamp': cookie['created'] + cocoa_offset,
+        'expires': cookie['expires'] + cocoa_offset,
+        'domain': cookie['domain'],
+        'name': cookie['name'],
+        'path': cookie['path'],
+        'value': cookie['value'],
+        'flags': cookie['flags'],
+        'source': source,
+        'record': cookie
+    }
+
+
+# Optional strings have an offset of 0 when they are missing
+def _read_optional_string(reader: BinaryReader, cookie_offset: int, offset: int) -> str | None:
+    return reader.read_cstring(cookie_offset + offset) if offset else None
+
+
+def _parse_cookie(reader: BinaryReader, cookie_offset: int) -> dict:
+    """
+    Decodes a single cookie at an absolute offset.
+    created and expires are left as raw Cocoa times (seconds since 2001-01-01 UTC).
+    """
+    (cookie_size, _, flags, port_count, urloffset, nameoffset, pathoffset, valueoffset,
+     commentoffset, commenturloffset, expiry_date, create_date) = reader.unpack_from(COOKIE_HEADER, cookie_offset)
+
+    # The port list follows the header as 16-bit port numbers
+    ports = []
+    if 0 < port_count and COOKIE_HEADER.size + 2 * port_count <= cookie_size:
+        ports = list(reader.unpack_array("<H", cookie_offset + COOKIE_HEADER.size, port_count))
+
+    return {
+        'domain': reader.read_cstring(cookie_offset + urloffset),
+        'name': reader.read_cstring(cookie_offset + nameoffset),
+        'path': reader.read_cstring(cookie_offset + pathoffset),
+        'value': reader.read_cstring(cookie_offset + valueoffset),
+        'comment': _read_optional_string(reader, cookie_offset, commentoffset),
+        'comment_url': _read_optional_string(reader, cookie_offset, commenturloffset),
+        'ports': ports,
+        'created': create_date,
+        'expires': expiry_date,
+        'flags': describe_cookie_flags(flags)
+    }
+
+
+def _read_page_table(reader: BinaryReader) -> list[tuple[int, int, int]]:
+    if len(reader) < FILE_HEADER.size or reader.read_uint32_le() != Magic._Magic:
+        raise ValueError("Not a valid Cookies.binarycookies file")
+
+    num_pages = reader.unpack_from(FILE_HEADER, 0)[1]
+    page_sizes = reader.unpack_array(">i", FILE_HEADER.size, num_pages)
+    page_offset = FILE_HEADER.size + 4 * num_pages
+    reader.check(page_offset, sum(page_sizes))
+
+    pages = []
+    for page_size in page_sizes:
+        # Skip page header
+        _, num_cookies = reader.unpack_from(PAGE_HEADER, page_offset)
+        pages.append((page_offset, page_size, num_cookies))
+        page_offset += page_size
+    return pages
+
+
+def read_page_table(data: bytes | mmap.mmap) -> list[tuple[int, int, int]]:
+    """
+    Reads the file header and every page header, without decoding any cookies.
+    Returns (offset, size, number of cookies) for each page.
+    """
+    with BinaryReader(data) as reader:
+        return _read_page_table(reader)
+
+
+def iter_binarycookies_pages(data: bytes | mmap.mmap) -> typing.Iterator[dict]:
+    """
+    Decodes a binarycookies file one page at a time.
+    Yields a dictionary per page with its number, size and cookies,
+    nothing is printed or written.
+    """
+    with BinaryReader(data) as reader:
+        for page_num, (page_offset, page_size, num_cookies) in enumerate(_read_page_table(reader), 1):
+            cookie_offsets = reader.unpack_array("<i", page_offset + PAGE_HEADER.size, num_cookies)
+            yield {
+                "Page Num": page_num,
+                "Size": page_size,
+                "# of Cookies": num_cookies,
+                "Cookie Data": [_parse_cookie(reader, page_offset + offset) for offset in cookie_offsets]
+            }
+
+
+# Parses the contents of a binarycookies file into a list of pages
+def parse_binarycookies(data: bytes | mmap.mmap) -> list[dict]:
+    return list(iter_binarycookies_pages(data))
+
+
+# Memory-maps a binarycookies file so only the page being decoded is paged in
+@contextlib.contextmanager
+def open_binarycookies(file_path) -> typing.Iterator[bytes | mmap.mmap]:
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+# Reads and parses a binarycookies file without any output
+def read_binarycookies(file_path) -> list[dict]:
+    with open_binarycookies(file_path) as data:
+        return parse_binarycookies(data)
+
+
+OUTPUT_SUFFIXES = {'json': '.json', 'ndjson': '.ndjson', 'csv': '.csv'}
+CSV_COLUMNS = ["page", "domain", "name", "path", "value", "comment", "comment_url", "ports", "created", "expires", "flags"]
+
+
+class CookieWriter:
+    """
+    Writes pages of cookies to a file as they are decoded.
+    json keeps the layout of json.dump(indent=4) over all pages, ndjson and
+    csv write one cookie per line and txt writes one field per line.
+    ndjson keeps raw Cocoa times, the other formats write ISO 8601 times.
+    Everything goes through one large write buffer.
+    """
+
+    def __init__(self, output_file, output_format, page_count):
+        self.output_format = output_format
+        self.page_count = page_count
+        self.pages_written = 0
+        self._file = open(output_file, 'w', buffering=WRITE_BUFFER_SIZE, newline='' if output_format == 'csv' else None)
+        if output_format == 'json':
+            self._file.write("[")
+        elif output_format == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(CSV_COLUMNS)
+
+    def write_page(self, page: dict):
+        if self.output_format == 'json':
+            self._file.write(",\n    " if self.pages_written else "\n    ")
+            page = {**page, "Cookie Data": [format_cookie(cookie) for cookie in page['Cookie Data']]}
+            self._file.write(json.dumps(page, indent=4).replace("\n", "\n    "))
+        elif self.output_format == 'ndjson':
+            for cookie in page['Cookie Data']:
+                self._file.write(json.dumps({"page": page['Page Num'], **cookie}))
+                self._file.write("\n")
+        elif self.output_format == 'csv':
+            for cookie in page['Cookie Data']:
+                cookie = format_cookie(cookie)
+                cookie['ports'] = ' '.join(str(port) for port in cookie['ports'])
+                self._csv.writerow([page['Page Num']] + [cookie[column] for column in CSV_COLUMNS[1:]])
+        else:
+            lines = [
+                f"Page: {page['Page Num']} of {self.page_count}",
+                f"Size: {page['Size']}",
+                f"Cookies: {page['# of Cookies']}",
+                ""
+            ]
+            for cookie in map(format_cookie, page['Cookie Data']):
+                lines += [
+                    f"Domain: {cookie['domain']}",
+                    f"Name: {cookie['name']}",
+                    f"Path: {cookie['path']}",
+                    f"Value: {cookie['value']}",
+                    f"Comment: {cookie['comment'] or ''}",
+                    f"Comment URL: {cookie['comment_url'] or ''}",
+                    f"Ports: {' '.join(str(port) for port in cookie['ports'])}",
+                    f"Created: {cookie['created']}",
+                    f"Expires: {cookie['expires']}",
+                    f"Flags: {cookie['flags']}",
+                    ""
+                ]
+            self._file.write("\n".join(lines) + "\n")
+        self.pages_written += 1
+
+    def close(self):
+        if self.output_format == 'json':
+            self._file.write("\n]" if self.pages_written else "]")
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 class Cookies:
-    def __init__(self, file_path, output_file, format):
+    # data can hold the file contents (e.g. an archive member), file_path then only names it
+    def __init__(self, file_path, output_file, format, case_store=None, metrics=NO_METRICS, data=None):
         self.file_path = pathlib.Path(file_path) if isinstance(file_path, str) else file_path
+        self.data = data
         self.output_file = pathlib.Path(output_file) if isinstance(output_file, str) else output_file
         self.format = format
+        self.case_store = case_store
+        self.metrics = metrics
         self.page_sizes = []
         self.total_cookies = 0
-        self.all_pages = []  # To store detailed info about each page
-        with open(self.file_path, 'rb') as file:
-            self.br = BinaryReader(file)
-            self._read_file()
+        self._Magic = Magic._Magic
+        self._read_file()
 
     def _read_file(self):
-        # Read magic number
-        self._Magic = self.br.read_uint32()
-        if self._Magic != Magic._Magic:
-            raise ValueError("Not a valid Cookies.binarycookies file")
-        print(f"Magic number: {self._Magic}")
-
-        # Read number of pages
-        num_pages = self.br.read_int32()
-        print(f"Number of pages: {num_pages}")
-
-        # Read page sizes
-        total_page_size = 0
-        for i in range(num_pages):
-            page_size = self.br.read_int32()
-            self.page_sizes.append(page_size)
-            total_page_size += page_size
-
-        print(f"Total size of pages: {total_page_size}")
-
-        # Read each page            
-        pages = [self.br.read_raw(page_size) for page_size in self.page_sizes]
-        for page_num, page_data in enumerate(pages, 1):
-            self._process_page(page_data, page_num)
-
-        print(f"Total Cookies: {self.total_cookies}")
-        self._print_values()
-        self.json_format()
-
-    def _process_page(self, page_data, page_num):
-        page = BytesIO(page_data)
-        br_page = BinaryReader(page)
-        br_page.read2_int32()  # Skip page header
-        num_cookies = br_page.read2_int32()
-        self.total_cookies += num_cookies
-        cookie_offsets = [br_page.read2_int32() for _ in range(num_cookies)]
-        br_page.read2_int32()  # Skip footer
-
-        cookies_data = []
-        for offset in cookie_offsets:
-            cookies_data.append(self._process_cookie(page_data, offset))
-
-        # Collect page data
-        page_info = {
-            "Page Num": page_num,
-            "Size": self.page_sizes[page_num - 1],
-            "# of Cookies": num_cookies,
-            "Cookie Data": cookies_data
-        }
-        self.all_pages.append(page_info)
-
-    def _process_cookie(self, page_data: bytes, offset: int) -> dict:
-        """Process a single cookie from a binarycookies file."""
-
-        cookie_stream = BytesIO(page_data)
-        cookie_stream.seek(offset)
-
-        cookie_size = BinaryReader(cookie_stream).read2_int32()
-        cookie_data = cookie_stream.read(cookie_size)
-
-        cookie = BytesIO(cookie_data)
-        br_cookie = BinaryReader(cookie)
-
-        br_cookie.read_raw(4)  # skipping bytes
-
-        flags = br_cookie.read2_int32()
-        cookie_flags = {
-            0: '',
-            1: 'Secure',
-            4: 'HttpOnly',
-            5: 'Secure; HttpOnly'
-        }.get(flags, 'Unknown')
-
-        br_cookie.read_raw(4)  # skipping bytes
-
-        urloffset, nameoffset, pathoffset, valueoffset = br_cookie.read_offsets()
-
-        br_cookie.read_raw(8)  # skipping bytes
-
-        # Convert date values
-        expiry_date = br_cookie.read_datetime()
-        create_date = br_cookie.read_datetime()
-
-        # Read string values
-        domain = self._read_string(cookie, urloffset)
-        name = self._read_string(cookie, nameoffset)
-        path = self._read_string(cookie, pathoffset)
-        value = self._read_string(cookie, valueoffset)
-
-        return {
-            'domain': domain,
-            'name': name,
-            'path': path,
-            'value': value,
-            'created': create_date,
-            'expires': expiry_date,
-            'flags': cookie_flags
-        }
-
-
-    # Function to read string values from the binarycookies file
-    def _read_string(self, cookie, offset):
-        cookie.seek(offset - 4)
-        result = b""
-        while True:
-            byte = cookie.read(1)
-            if byte == b'\x00':
-                break
-            result += byte
-        return result.decode('utf-8')
-
+        source = contextlib.nullcontext(self.data) if self.data is not None else open_binarycookies(self.file_path)
+        with source as data:
+            # The page headers give all the totals, cookies are only decoded while writing
+            with self.metrics.stage("page_table"):
+                page_table = read_page_table(data)
+            self.metrics.count("page_table", bytes=len(data))
+            self.page_sizes = [page_size for _, page_size, _ in page_table]
+            self.total_cookies = sum(num_cookies for _, _, num_cookies in page_table)
+
+            print(f"Magic number: {self._Magic}")
+            print(f"Number of pages: {len(self.page_sizes)}")
+            print(f"Total size of pages: {sum(self.page_sizes)}")
+            print(f"Total Cookies: {self.total_cookies}")
+            self._print_values(page_table)
+            self.json_format(iter_binarycookies_pages(data))
 
     # Print a summary of the parsed data
-    def _print_values(self):
-        page_len = len(self.all_pages)
-        for page in self.all_pages:
-            print(f"\nPage: {page['Page Num']} of {page_len}")
-            print(f"Size: {page['Size']}")
-            print(f"Cookies: {page['# of Cookies']}")
+    def _print_values(self, page_table):
+        page_len = len(page_table)
+        for page_num, (_, page_size, num_cookies) in enumerate(page_table, 1):
+            print(f"\nPage: {page_num} of {page_len}")
+            print(f"Size: {page_size}")
+            print(f"Cookies: {num_cookies}")
     
     
-    def json_format(self):
+    def json_format(self, pages):
         # Ensure the output directory exists
         if not self.output_file.parent.exists():
             os.makedirs(self.output_file.parent)
 
-        # Export the parsed data to a JSON file
-        if self.format == 'json':
-            self.output_file = self.output_file.with_suffix('.json')
-            with open(self.output_file, 'w') as json_file:
-                json.dump(self.all_pages, json_file, indent=4)
-        else:
-            self.output_file = self.output_file.with_suffix('.txt')
-            with open(self.output_file, 'w') as txt_file:
-                page_len = len(self.all_pages)
-                for page in self.all_pages:
-                    txt_file.write(f"\nPage: {page['Page Num']} of {page_len}")
-                    txt_file.write(f"Size: {page['Size']}")
-                    txt_file.write(f"Cookies: {page['# of Cookies']}")
-                    for cookie in page['Cookie Data']:
-                        txt_file.write(f"\nDomain: {cookie['domain']}")
-                        txt_file.write(f"Name: {cookie['name']}")
-                        txt_file.write(f"Path: {cookie['path']}")
-                        txt_file.write(f"Value: {cookie['value']}")
-                        txt_file.write(f"Created: {cookie['created']}")
-                        txt_file.write(f"Expires: {cookie['expires']}")
-                        txt_file.write(f"Flags: {cookie['flags']}")
+        # Export each page as soon as it is decoded, txt unless another format was asked for
+        output_format = self.format if self.format in OUTPUT_SUFFIXES else 'txt'
+        self.output_file = self.output_file.with_suffix(OUTPUT_SUFFIXES.get(output_format, '.txt'))
+        with CookieWriter(self.output_file, output_format, len(self.page_sizes)) as writer:
+            # "parse" is the time spent decoding each page
+            for page in self.metrics.timed_iter("parse", pages, counter="pages"):
+                self.metrics.count("parse", cookies=page["# of Cookies"])
+                with self.metrics.stage("write"):
+                    writer.write_page(page)
+                if self.case_store:
+                    with self.metrics.stage("case_db"):
+                        self.case_store.add_many('cookies', (cookie_case_row(cookie, str(self.file_path))
+                                                             for cookie in page['Cookie Data']))
                         
     def __str__(self):
         
@@ -244,23 +340,121 @@ class Cookies:
         )
         return str_output
 
-def main(args):
-    input_path = pathlib.Path(args.i)
+# Worker for merge_cookie_files, returns the cookie rows of one file or the error it hit
+def _read_cookie_rows(file_path: str) -> tuple[str, list[dict] | None, str | None]:
+    try:
+        pages = read_binarycookies(file_path)
+    except Exception as e:
+        return file_path, None, str(e)
+    rows = []
+    for page in pages:
+        for cookie in page["Cookie Data"]:
+            rows.append({"source": file_path, "page": page["Page Num"], **cookie})
+    return file_path, rows, None
+
+
+COOKIE_COLUMNS = ["source", "page", "domain", "name", "path", "value", "comment", "comment_url", "ports",
+                  "created", "expires", "flags"]
+
+
+def merge_cookie_files(file_paths, output_path, output_format="ndjson", workers=None, case_store=None,
+                       metrics=NO_METRICS) -> int:
+    """
+    Parses many binarycookies files in a process pool and writes all of
+    their cookies to one NDJSON file or SQLite database. Every cookie is
+    tagged with the file it came from, created and expires are kept as
+    raw Cocoa times. Cookies are also added to case_store when one is given.
+    The "parse" stage is the time spent waiting on the workers.
+    Returns the number of cookies written.
+    """
+    # only merging needs these, a single file is parsed without them
+    import sqlite3
+    from concurrent.futures import ProcessPoolExecutor
+
+    output_path = pathlib.Path(output_path)
+    if output_format == "sqlite":
+        connection = sqlite3.connect(output_path)
+        connection.execute(f"CREATE TABLE IF NOT EXISTS cookies ({', '.join(COOKIE_COLUMNS)})")
+        insert = f"INSERT INTO cookies VALUES ({', '.join('?' for _ in COOKIE_COLUMNS)})"
+    else:
+        output_file = open(output_path, 'w')
+
+    total = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_read_cookie_rows, [str(path) for path in file_paths])
+            for file_path, rows, error in metrics.timed_iter("parse", results, counter="files"):
+                if error is not None:
+                    print(f"Skipping {file_path}: {error}")
+                    metrics.count("parse", failed=1)
+                    continue
+                if case_store:
+                    with metrics.stage("case_db"):
+                        case_store.add_many('cookies', (cookie_case_row(row, file_path) for row in rows))
+                with metrics.stage("write"):
+                    if output_format == "sqlite":
+                        for row in rows:
+                            row['ports'] = ','.join(str(port) for port in row['ports'])
+                        connection.executemany(insert, [[row[column] for column in COOKIE_COLUMNS] for row in rows])
+                    else:
+                        output_file.writelines(json.dumps(row) + "\n" for row in rows)
+                metrics.count("write", cookies=len(rows))
+                total += len(rows)
+                print(f"{file_path}: {len(rows)} cookies")
+    finally:
+        if output_format == "sqlite":
+            connection.commit()
+            connection.close()
+        else:
+            output_file.close()
+    return total
+
+
+# Finds every *.binarycookies file below the given directories
+def find_cookie_files(directories) -> list[pathlib.Path]:
+    found = []
+    for directory in directories:
+        found.extend(sorted(pathlib.Path(directory).expanduser().rglob("*.binarycookies")))
+    return found
+
+
+def export_cookies(args, metrics=NO_METRICS):
+    with metrics.stage("scan"):
+        input_paths = [pathlib.Path(path) for path in args.i] + find_cookie_files(args.d)
     output_path = pathlib.Path(args.o)
     
     # Ensure the directory exists before creating the file
     if not output_path.parent.exists():
         os.makedirs(output_path.parent)
-    
-    Cookies(input_path, output_path, args.f)
+
+    case_store = None
+    if args.case_db:
+        from case_store import CaseStore
+        case_store = CaseStore(args.case_db)
+    try:
+        # A single file keeps the per-page output, anything else is merged
+        if len(input_paths) == 1 and not args.d and args.f != 'sqlite':
+            Cookies(input_paths[0], output_path, args.f, case_store, metrics)
+        else:
+            total = merge_cookie_files(input_paths, output_path, args.f or 'ndjson', args.w, case_store, metrics)
+            print(f"Total Cookies: {total} from {len(input_paths)} files saved to {output_path}")
+    finally:
+        if case_store:
+            with metrics.stage("case_db"):
+                case_store.close()
+            print(f"Cookies loaded into {args.case_db}")
     
     """ print(f"\n\nInput file: {input_path}")
     print(f"Output directory: {output_path.resolve()}") """
 
-if __name__ == "__main__":
+def main(argv=None):
     try:
-        args = parse_arguments()
-        main(args)
+        args = parse_arguments(argv)
+        with Metrics.from_args("bcf_parser", args) as metrics:
+            export_cookies(args, metrics)
     except Exception as e:
         print("An error occurred: ", e)
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
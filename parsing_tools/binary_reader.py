@@ -0,0 +1,142 @@
+import io
+import mmap
+import struct
+import typing
+
+__description__ = "A bounds checked reader for binary formats, shared by the parsers in this repository"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# precompiled layouts for the single value readers
+INT32_BE = struct.Struct(">i")
+INT32_LE = struct.Struct("<i")
+UINT32_BE = struct.Struct(">I")
+UINT32_LE = struct.Struct("<I")
+UINT64_LE = struct.Struct("<Q")
+DOUBLE_LE = struct.Struct("<d")
+
+# strings are searched for their terminator this many bytes at a time when the buffer has no find()
+STRING_SEARCH_CHUNK = 256
+
+Buffer = typing.Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+class BinaryReader:
+    """
+    Reads fixed layout values out of anything that supports the buffer
+    protocol (bytes, bytearray, mmap, memoryview) without copying it.
+    Values can be read at absolute offsets or from a cursor, every read is
+    checked against the end of the buffer and raises ValueError when it
+    would run past it. Slices come back as memoryviews of the buffer.
+    Use it as a context manager (or call release) so an mmap can be closed
+    once reading is done.
+    """
+
+    def __init__(self, buffer: Buffer):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        self.view = view if view.format == "B" and view.ndim == 1 else view.cast("B")
+        self.position = 0
+
+    def release(self):
+        self.view.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __len__(self):
+        return len(self.view)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if not 0 <= offset <= len(self.view):
+            raise ValueError(f"Cannot seek to offset {offset} in a buffer of {len(self.view)} bytes")
+        self.position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self.position
+
+    def check(self, offset: int, count: int):
+        """Raises ValueError unless count bytes can be read at offset."""
+        if offset < 0 or count < 0 or offset + count > len(self.view):
+            raise ValueError(f"Could not read expected bytes: {count} at offset {offset}, "
+                             f"buffer is {len(self.view)} bytes")
+
+    # absolute reads
+
+    def unpack_from(self, layout: struct.Struct, offset: int) -> tuple:
+        self.check(offset, layout.size)
+        return layout.unpack_from(self.view, offset)
+
+    def iter_unpack(self, layout: struct.Struct, offset: int, count: int) -> typing.Iterator[tuple]:
+        """Unpacks count back-to-back records of the same layout in one call."""
+        self.check(offset, layout.size * count)
+        return layout.iter_unpack(self.view[offset:offset + layout.size * count])
+
+    def unpack_array(self, type_code: str, offset: int, count: int) -> tuple:
+        """Unpacks count values of one struct type code at offset, e.g. unpack_array("<i", 8, 4)."""
+        if count < 0:
+            raise ValueError(f"Cannot read {count} values at offset {offset}")
+        byte_order, code = type_code[:-1], type_code[-1]
+        layout = struct.Struct(f"{byte_order}{count}{code}")
+        return self.unpack_from(layout, offset)
+
+    def slice(self, offset: int, count: int) -> memoryview:
+        self.check(offset, count)
+        return self.view[offset:offset + count]
+
+    def read_cstring(self, offset: int, encoding: str = "utf-8") -> str:
+        """Decodes a NUL terminated string that starts at offset."""
+        self.check(offset, 0)
+        end = self._find_nul(offset)
+        if end == -1:
+            raise ValueError(f"Unterminated string at offset {offset}")
+        return str(self.view[offset:end], encoding)
+
+    def _find_nul(self, offset: int) -> int:
+        find = getattr(self.buffer, "find", None)
+        if find is not None:
+            return find(b"\x00", offset)
+        # memoryviews can't be searched directly, so small chunks are copied instead
+        for chunk_offset in range(offset, len(self.view), STRING_SEARCH_CHUNK):
+            index = bytes(self.view[chunk_offset:chunk_offset + STRING_SEARCH_CHUNK]).find(b"\x00")
+            if index != -1:
+                return chunk_offset + index
+        return -1
+
+    # cursor reads
+
+    def unpack(self, layout: struct.Struct) -> tuple:
+        values = self.unpack_from(layout, self.position)
+        self.position += layout.size
+        return values
+
+    def read_raw(self, count: int) -> memoryview:
+        result = self.slice(self.position, count)
+        self.position += count
+        return result
+
+    def read_int32_be(self) -> int:
+        return self.unpack(INT32_BE)[0]
+
+    def read_int32_le(self) -> int:
+        return self.unpack(INT32_LE)[0]
+
+    def read_uint32_be(self) -> int:
+        return self.unpack(UINT32_BE)[0]
+
+    def read_uint32_le(self) -> int:
+        return self.unpack(UINT32_LE)[0]
+
+    def read_uint64_le(self) -> int:
+        return self.unpack(UINT64_LE)[0]
+
+    def read_double_le(self) -> float:
+        return self.unpack(DOUBLE_LE)[0]
@@ -0,0 +1,115 @@
+import json
+import sqlite3
+
+__description__ = "A SQLite case database that the parsers can bulk-load their records into"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# Rows are inserted with executemany this many at a time
+BATCH_SIZE = 10000
+
+# One table per artifact type: its columns and the columns that get an index.
+# timestamp is always seconds since the Unix epoch (UTC) and record holds the full record as JSON.
+TABLES = {
+    "imessage": {
+        "columns": ["timestamp", "thread", "handle", "sender", "recipient", "service", "message",
+                    "attachment_path", "source", "record"],
+        "indexes": ["timestamp", "handle", "thread"],
+    },
+    "knowledgec": {
+        "columns": ["timestamp", "end_timestamp", "stream", "bundle_id", "value", "source", "record"],
+        "indexes": ["timestamp", "bundle_id", "stream"],
+    },
+    "segb": {
+        "columns": ["timestamp", "stream", "file", "offset", "state", "data", "source", "record"],
+        "indexes": ["timestamp", "stream"],
+    },
+    "cookies": {
+        "columns": ["timestamp", "expires", "domain", "name", "path", "value", "flags", "source", "record"],
+        "indexes": ["timestamp", "domain"],
+    },
+}
+COLUMN_TYPES = {"timestamp": "REAL", "end_timestamp": "REAL", "expires": "REAL", "offset": "INTEGER", "state": "INTEGER"}
+
+
+class CaseStore:
+    """
+    Collects records from any of the tools into one case database.
+    The database runs in WAL mode, rows are buffered and written with
+    executemany in batches, and indexes are only built when the store is
+    closed, so loading isn't slowed down by index maintenance. When a run
+    loads into a database that already has them, the indexes of each table
+    it writes to are dropped before its first batch and rebuilt on close.
+    Use it as a context manager so the last batch and the indexes are written.
+    """
+
+    def __init__(self, database_path, batch_size=BATCH_SIZE):
+        self.database_path = database_path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(database_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._pending: dict[str, list[tuple]] = {}
+        # tables whose indexes have been dropped for this load
+        self._loading: set[str] = set()
+        self.counts: dict[str, int] = {}
+        for table, layout in TABLES.items():
+            columns = ", ".join(f'"{column}" {COLUMN_TYPES.get(column, "TEXT")}' for column in layout["columns"])
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+
+    def add(self, table, row: dict):
+        """
+        Queues one row for a table. Missing columns are stored as NULL,
+        record is serialised to JSON.
+        """
+        columns = TABLES[table]["columns"]
+        values = []
+        for column in columns:
+            value = row.get(column)
+            if column == "record" and value is not None:
+                value = json.dumps(value)
+            values.append(value)
+        pending = self._pending.setdefault(table, [])
+        pending.append(tuple(values))
+        if len(pending) >= self.batch_size:
+            self.flush(table)
+
+    def add_many(self, table, rows):
+        for row in rows:
+            self.add(table, row)
+
+    def flush(self, table=None):
+        for name in [table] if table else list(self._pending):
+            rows = self._pending.get(name)
+            if not rows:
+                continue
+            placeholders = ", ".join("?" for _ in TABLES[name]["columns"])
+            with self.connection:
+                if name not in self._loading:
+                    self._drop_indexes(name)
+                    self._loading.add(name)
+                self.connection.executemany(f"INSERT INTO {name} VALUES ({placeholders})", rows)
+            self.counts[name] = self.counts.get(name, 0) + len(rows)
+            self._pending[name] = []
+
+    def _drop_indexes(self, table):
+        for column in TABLES[table]["indexes"]:
+            self.connection.execute(f"DROP INDEX IF EXISTS {table}_{column}_index")
+
+    def create_indexes(self):
+        with self.connection:
+            for table, layout in TABLES.items():
+                for column in layout["indexes"]:
+                    self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column}_index ON {table} ("{column}")')
+        self._loading.clear()
+
+    def close(self):
+        self.flush()
+        self.create_indexes()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+__description__ = "Cocoa epoch constant and the time arguments shared by the parsers"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# Seconds between the Unix epoch and the Cocoa epoch (2001-01-01 UTC)
+COCOA_EPOCH_OFFSET = 978307200
+
+
+def parse_time_argument(value):
+    # Accepts ISO 8601 dates and times, naive values are treated as local time
+    return datetime.fromisoformat(value)
+
+
+def to_cocoa_time(value):
+    # Converts a datetime to seconds since the Cocoa epoch
+    return value.timestamp() - COCOA_EPOCH_OFFSET
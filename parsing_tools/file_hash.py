@@ -0,0 +1,22 @@
+import hashlib
+
+__description__ = "Hashes evidence files in large blocks, shared by file_scraper and iMessageQuery"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# Files are hashed in 1 MiB blocks
+HASH_BLOCK_SIZE = 1 << 20
+
+
+# SHA-256 of a file, read in large blocks into one reused buffer
+def sha256_file(file_path, block_size=HASH_BLOCK_SIZE) -> str:
+    digest = hashlib.sha256()
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.hexdigest()
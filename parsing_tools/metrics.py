@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import datetime
+import contextlib
+import typing
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+__description__ = "Per-stage timing, counters and optional cProfile dumps for the tools in this repository"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+
+def add_metrics_arguments(parser):
+    """Adds the --metrics and --profile options every tool shares."""
+    parser.add_argument("--metrics", dest="metrics_file", help="Save per-stage timings and counters to this JSON file")
+    parser.add_argument("--profile", dest="profile_file", help="Run under cProfile and save the stats to this file (read with pstats)")
+
+
+def peak_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Stage:
+    __slots__ = ("_stage", "_started")
+
+    def __init__(self, stage: dict):
+        self._stage = stage
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stage["seconds"] += time.perf_counter() - self._started
+        self._stage["calls"] += 1
+
+
+class Metrics:
+    """
+    Collects the wall time spent in each named stage of a run together with
+    counters such as records, rows and bytes, and saves them as JSON.
+    A disabled instance does nothing, so the tools can pass one around
+    unconditionally: stage() hands back a shared null context and
+    timed_iter() returns the iterable unchanged.
+    Used as a context manager it times the whole run, runs cProfile when a
+    profile path is given and writes the metrics file on exit.
+    """
+
+    def __init__(self, tool: str, metrics_file=None, profile_file=None, enabled: bool = True):
+        self.tool = tool
+        self.metrics_file = metrics_file
+        self.profile_file = profile_file
+        self.enabled = enabled
+        self.stages: dict[str, dict] = {}
+        self._null_stage = contextlib.nullcontext()
+        self._profiler = None
+        self._started = None
+        self._started_at = None
+        self.total_seconds = None
+
+    @classmethod
+    def from_args(cls, tool: str, args):
+        """Builds the metrics for a run from the --metrics/--profile options, disabled when neither is given."""
+        metrics_file = getattr(args, "metrics_file", None)
+        profile_file = getattr(args, "profile_file", None)
+        return cls(tool, metrics_file, profile_file, enabled=bool(metrics_file or profile_file))
+
+    def __bool__(self):
+        return self.enabled
+
+    def _stage(self, name: str) -> dict:
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {"seconds": 0.0, "calls": 0}
+        return stage
+
+    def stage(self, name: str):
+        """Times a block of code, e.g. `with metrics.stage("query"): ...`."""
+        if not self.enabled:
+            return self._null_stage
+        return _Stage(self._stage(name))
+
+    def count(self, name: str, **counters: int):
+        """Adds to the counters of a stage, e.g. count("write", records=1, bytes=120)."""
+        if not self.enabled:
+            return
+        stage = self._stage(name)
+        for counter, value in counters.items():
+            stage[counter] = stage.get(counter, 0) + value
+
+    def timed_iter(self, name: str, iterable: typing.Iterable, counter: str = "records") -> typing.Iterable:
+        """
+        Yields from iterable, counting the time spent producing each item
+        (not the time the caller spends on it) towards the named stage.
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(self._stage(name), iterable, counter)
+
+    @staticmethod
+    def _timed_iter(stage: dict, iterable: typing.Iterable, counter: str):
+        iterator = iter(iterable)
+        perf_counter = time.perf_counter
+        stage.setdefault(counter, 0)
+        while True:
+            started = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stage["seconds"] += perf_counter() - started
+                return
+            stage["seconds"] += perf_counter() - started
+            stage["calls"] += 1
+            stage[counter] += 1
+            yield item
+
+    def start(self):
+        self._started_at = datetime.datetime.now(datetime.timezone.utc)
+        self._started = time.perf_counter()
+        if self.enabled and self.profile_file:
+            # imported here so runs without --profile don't pay for it
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def finish(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_file)
+            self._profiler = None
+        if self._started is not None:
+            self.total_seconds = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        return {
+            "tool": self.tool,
+            "argv": sys.argv,
+            "started": self._started_at.isoformat() if self._started_at else None,
+            "total_seconds": self.total_seconds,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "pid": os.getpid(),
+            "profile_file": str(self.profile_file) if self.profile_file else None,
+            "stages": self.stages
+        }
+
+    def write(self, metrics_file=None):
+        metrics_file = metrics_file or self.metrics_file
+        with open(metrics_file, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+        print(f"Metrics saved to {metrics_file}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish()
+        if self.enabled and self.metrics_file:
+            self.write()
+        if self.profile_file and self.enabled:
+            print(f"Profile saved to {self.profile_file}")
+
+
+# shared by every function that wasn't given metrics to record into
+NO_METRICS = Metrics("none", enabled=False)
@@ -0,0 +1,117 @@
+import mmap
+import struct
+import sys
+import pathlib
+import tempfile
+import unittest
+
+# binary_reader lives one folder up, in parsing_tools
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+from binary_reader import BinaryReader, DOUBLE_LE, INT32_BE, INT32_LE
+
+RECORD = struct.Struct("<Ii")
+# three little-endian (uint32, int32) records followed by a double
+DATA = RECORD.pack(1, -1) + RECORD.pack(2, -2) + RECORD.pack(3, -3) + DOUBLE_LE.pack(1.5)
+
+
+class UnpackFromTests(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = BinaryReader(DATA)
+
+    def test_reads_at_absolute_offsets(self):
+        self.assertEqual(self.reader.unpack_from(RECORD, 0), (1, -1))
+        self.assertEqual(self.reader.unpack_from(RECORD, 16), (3, -3))
+        self.assertEqual(self.reader.unpack_from(DOUBLE_LE, 24), (1.5,))
+
+    def test_does_not_move_the_cursor(self):
+        self.reader.unpack_from(RECORD, 8)
+        self.assertEqual(self.reader.tell(), 0)
+
+    def test_reads_up_to_the_last_byte(self):
+        self.assertEqual(self.reader.unpack_from(INT32_LE, len(DATA) - 4), struct.unpack("<i", DATA[-4:]))
+
+    def test_truncated_buffer_raises_value_error(self):
+        reader = BinaryReader(DATA[:6])
+        with self.assertRaises(ValueError):
+            reader.unpack_from(RECORD, 0)
+
+    def test_read_past_the_end_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.reader.unpack_from(DOUBLE_LE, len(DATA) - 4)
+
+    def test_offset_past_the_end_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.reader.unpack_from(INT32_LE, len(DATA) + 8)
+
+    def test_negative_offset_raises_value_error(self):
+        # a negative offset must not wrap around to the end of the buffer
+        with self.assertRaises(ValueError):
+            self.reader.unpack_from(INT32_LE, -4)
+
+    def test_empty_buffer_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            BinaryReader(b"").unpack_from(INT32_BE, 0)
+
+
+class UnpackArrayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = BinaryReader(DATA)
+
+    def test_reads_count_values_at_offset(self):
+        self.assertEqual(self.reader.unpack_array("<i", 4, 3), (-1, 2, -2))
+
+    def test_byte_order_comes_from_the_type_code(self):
+        self.assertEqual(self.reader.unpack_array(">I", 0, 1), (0x01000000,))
+
+    def test_same_offset_position_as_unpack_from(self):
+        self.assertEqual(self.reader.unpack_array("<i", 8, 1), self.reader.unpack_from(INT32_LE, 8))
+
+    def test_zero_count_is_empty(self):
+        self.assertEqual(self.reader.unpack_array("<i", len(DATA), 0), ())
+
+    def test_truncated_buffer_raises_value_error(self):
+        reader = BinaryReader(DATA[:10])
+        with self.assertRaises(ValueError):
+            reader.unpack_array("<i", 4, 2)
+
+    def test_count_past_the_end_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.reader.unpack_array("<I", 0, len(DATA) // 4 + 1)
+
+    def test_negative_offset_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.reader.unpack_array("<i", -8, 2)
+
+    def test_offset_past_the_end_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.reader.unpack_array("<i", len(DATA) + 4, 1)
+
+    def test_negative_count_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.reader.unpack_array("<i", 0, -1)
+
+
+class BufferTypeTests(unittest.TestCase):
+
+    def test_memoryview_and_bytearray_read_the_same_values(self):
+        for buffer in (bytearray(DATA), memoryview(DATA), memoryview(DATA)[8:]):
+            reader = BinaryReader(buffer)
+            expected = struct.unpack_from("<Ii", bytes(buffer), 0)
+            self.assertEqual(reader.unpack_from(RECORD, 0), expected)
+
+    def test_mmap_is_read_in_place(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(DATA)
+            f.flush()
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with BinaryReader(mapped) as reader:
+                self.assertEqual(reader.unpack_array("<i", 4, 1), (-1,))
+                with self.assertRaises(ValueError):
+                    reader.unpack_from(DOUBLE_LE, len(DATA) - 1)
+            mapped.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import sys
+import pathlib
+import sqlite3
+import tempfile
+import unittest
+
+# case_store lives one folder up, in parsing_tools
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+from case_store import TABLES, CaseStore
+
+
+def index_names(database_path, table):
+    connection = sqlite3.connect(database_path)
+    try:
+        return {row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table,))}
+    finally:
+        connection.close()
+
+
+def expected_indexes(table):
+    return {f"{table}_{column}_index" for column in TABLES[table]["indexes"]}
+
+
+class IndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_path = str(pathlib.Path(self.directory.name) / "case.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, store, count):
+        for number in range(count):
+            store.add("cookies", {"timestamp": number, "domain": f"example{number}.com", "record": {"n": number}})
+
+    def test_indexes_are_built_on_close(self):
+        with CaseStore(self.database_path, batch_size=2) as store:
+            self.load(store, 5)
+            self.assertEqual(index_names(self.database_path, "cookies"), set())
+        self.assertEqual(index_names(self.database_path, "cookies"), expected_indexes("cookies"))
+
+    def test_later_loads_drop_the_indexes_until_close(self):
+        with CaseStore(self.database_path) as store:
+            self.load(store, 3)
+        with CaseStore(self.database_path, batch_size=2) as store:
+            self.load(store, 3)
+            self.assertEqual(index_names(self.database_path, "cookies"), set())
+            # tables this run doesn't write to keep theirs
+            self.assertEqual(index_names(self.database_path, "segb"), expected_indexes("segb"))
+        self.assertEqual(index_names(self.database_path, "cookies"), expected_indexes("cookies"))
+        connection = sqlite3.connect(self.database_path)
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM cookies").fetchone()[0], 6)
+        connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,29 @@
+import io
 import sys
+import pathlib
 import biplist
 import base64
+from argparse import ArgumentParser
 from datetime import datetime
 
-__description__ = "Converts Apple binary PList files into a human-readable data structure"
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "parsing_tools"))
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
+from xml_plist import XMLPlistError, is_xml_plist, read_xml_plist
+
+__description__ = "Converts Apple binary and XML PList files into a human-readable data structure"
 __organization__ = "Omen-Cyber"
 __contact__ = "DaKota LaFeber"
 
 class plistError(Exception):
     pass
 
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description="A tool to convert Apple binary and XML PList files into a human-readable data structure")
+    parser.add_argument("file_path", help="File containing the binary or XML plist to parse")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
 def parse_plist(data):
     """
     Parses and decodes binary property list files.
@@ -21,6 +35,13 @@ def parse_plist(data):
     if isinstance(data, bytes) and data.startswith(b"bplist00"):
         plist = biplist.readPlistFromString(data)
         return parse_plist(plist)
+    elif isinstance(data, bytes) and is_xml_plist(data[:64]):
+        # blobs such as embedded SVGs start with <?xml too, those are kept as bytes
+        try:
+            plist = read_xml_plist(io.BytesIO(data))
+        except XMLPlistError:
+            return data
+        return parse_plist(plist)
     elif isinstance(data, dict):
         for key, value in data.items():
             if isinstance(value, biplist.Uid):
@@ -81,26 +102,40 @@ def custom_pretty_print(data, indent=0):
     pass
 
 
-def main(file_path):
+def print_plist(file_path, metrics=NO_METRICS):
     try:
-        with open(file_path, 'rb') as f:
-            # Checking magic number
-            if f.read(8) != b"bplist00":
-                raise plistError("Bad file header")
-
-            f.seek(0) # Starting back at the top of the file
-            plist = biplist.readPlist(f)
-
-        parsed_data = parse_plist(plist)
-        custom_pretty_print(parsed_data)
-        print()
-    except biplist.InvalidPlistException as e:
+        with metrics.stage("read"):
+            with open(file_path, 'rb') as f:
+                # Checking magic number, XML plists are read incrementally
+                header = f.read(64)
+                f.seek(0) # Starting back at the top of the file
+                if header.startswith(b"bplist00"):
+                    plist = biplist.readPlist(f)
+                elif is_xml_plist(header):
+                    plist = read_xml_plist(f)
+                else:
+                    raise plistError("Bad file header")
+                metrics.count("read", bytes=f.tell())
+
+        with metrics.stage("parse"):
+            parsed_data = parse_plist(plist)
+        with metrics.stage("print"):
+            custom_pretty_print(parsed_data)
+            print()
+    except (biplist.InvalidPlistException, XMLPlistError) as e:
         print(f"Error reading plist file: {e}")
+    except plistError as e:
+        print(f"Error: {e}")
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python plist_parse.py [file containing bplist to parse]")
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Usage: python plist_parse.py [file containing bplist or XML plist to parse]")
         sys.exit(1)
 
-    file_path = sys.argv[1]
-    main(file_path)
\ No newline at end of file
+    args = parse_arguments(argv)
+    with Metrics.from_args("plist_parser", args) as metrics:
+        print_plist(args.file_path, metrics)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import base64
+import datetime
+import xml.etree.ElementTree as ElementTree
+
+__description__ = "Reads XML property lists incrementally, so large ones are parsed with little more memory than their values need"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# what an XML plist can start with, after an optional byte order mark and whitespace
+XML_SIGNATURES = (b"<?xml", b"<!DOCTYPE plist", b"<plist")
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+class XMLPlistError(Exception):
+    pass
+
+
+def is_xml_plist(header: bytes) -> bool:
+    """Checks the first bytes of a file for an XML plist."""
+    header = header.removeprefix(UTF8_BOM).lstrip()
+    return header.startswith(XML_SIGNATURES)
+
+
+def _scalar(element):
+    tag = element.tag
+    text = element.text or ""
+    if tag == "string":
+        return text
+    if tag == "integer":
+        text = text.strip()
+        return int(text, 16) if text.lstrip("-").lower().startswith("0x") else int(text)
+    if tag == "real":
+        return float(text)
+    if tag == "true":
+        return True
+    if tag == "false":
+        return False
+    if tag == "date":
+        return datetime.datetime.strptime(text.strip(), "%Y-%m-%dT%H:%M:%SZ")
+    if tag == "data":
+        return base64.b64decode("".join(text.split()))
+    raise XMLPlistError(f"Unknown plist element <{tag}>")
+
+
+def read_xml_plist(fileobj):
+    """
+    Parses an XML plist from a binary file object with iterparse and returns
+    the same Python values as the binary reader (dict, list, str, int, float,
+    bool, datetime and bytes). Values are built as each element ends and the
+    element is removed from the tree straight away, so the parsed document is
+    never held in memory as XML elements.
+    """
+    # the containers being filled, with the key waiting for a value in each dict
+    containers = []
+    keys = []
+    elements = []
+    root = None
+    try:
+        for event, element in ElementTree.iterparse(fileobj, events=("start", "end")):
+            if event == "start":
+                if element.tag == "dict":
+                    containers.append({})
+                    keys.append(None)
+                elif element.tag == "array":
+                    containers.append([])
+                    keys.append(None)
+                elements.append(element)
+                continue
+
+            elements.pop()
+            tag = element.tag
+            if tag == "plist":
+                element.clear()
+                continue
+            if tag == "key":
+                if not keys:
+                    raise XMLPlistError("<key> outside a <dict>")
+                keys[-1] = element.text or ""
+                value = None
+            elif tag in ("dict", "array"):
+                value = containers.pop()
+                keys.pop()
+            else:
+                value = _scalar(element)
+
+            if tag != "key":
+                if not containers:
+                    root = value
+                elif isinstance(containers[-1], dict):
+                    if keys[-1] is None:
+                        raise XMLPlistError(f"<{tag}> without a <key> in a <dict>")
+                    containers[-1][keys[-1]] = value
+                    keys[-1] = None
+                else:
+                    containers[-1].append(value)
+            # drop the element from its parent so finished elements don't pile up
+            element.clear()
+            if elements:
+                elements[-1].remove(element)
+    except ElementTree.ParseError as e:
+        raise XMLPlistError(f"Invalid XML plist: {e}") from e
+    except (ValueError, IndexError) as e:
+        # well-formed XML with a bad value, e.g. an <integer> or <date> that doesn't parse or bad base64
+        # in <data> (binascii.Error is a ValueError)
+        raise XMLPlistError(f"Invalid XML plist value: {e!r}") from e
+    return root
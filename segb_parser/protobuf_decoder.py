@@ -0,0 +1,144 @@
+import math
+import struct
+import typing
+
+__description__ = "A schema-less decoder for the protobuf wire format used in SEGB record payloads"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# protobuf wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+FIXED32 = 5
+
+# nested messages deeper than this are left as strings or bytes
+MAX_DEPTH = 16
+
+# fixed fields are kept as unsigned integers (IDs, hashes), and also
+# read as a double/float under "<field>_double" and "<field>_float"
+UINT64_STRUCT = struct.Struct("<Q")
+DOUBLE_STRUCT = struct.Struct("<d")
+UINT32_STRUCT = struct.Struct("<I")
+FLOAT_STRUCT = struct.Struct("<f")
+
+
+class ProtobufError(Exception):
+    pass
+
+
+# reads a base 128 varint, returns the value and the offset after it
+def decode_varint(view: memoryview, offset: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    end = len(view)
+    while offset < end:
+        byte = view[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+        if shift >= 64:
+            raise ProtobufError("Varint is too long")
+    raise ProtobufError("Truncated varint")
+
+
+def _decode_length_delimited(view: memoryview, depth: int):
+    """
+    Works out what a length-delimited field holds: printable UTF-8 becomes a
+    string, anything that parses cleanly becomes a nested message and the
+    rest is returned as hex.
+    """
+    try:
+        text = str(view, "utf-8")
+        if text.isprintable():
+            return text
+    except UnicodeDecodeError:
+        pass
+    if depth < MAX_DEPTH and len(view):
+        try:
+            return _decode_message(view, depth + 1)
+        except ProtobufError:
+            pass
+    return view.hex()
+
+
+# NaN and infinity aren't valid JSON, so they become None
+def _finite(value: float) -> float | None:
+    return value if math.isfinite(value) else None
+
+
+# repeated fields are collected into a list
+def _add_field(fields: dict[str, typing.Any], name: str, value):
+    if name not in fields:
+        fields[name] = value
+    elif isinstance(fields[name], list):
+        fields[name].append(value)
+    else:
+        fields[name] = [fields[name], value]
+
+
+def _decode_message(view: memoryview, depth: int) -> dict[str, typing.Any]:
+    fields: dict[str, typing.Any] = {}
+    offset = 0
+    end = len(view)
+    while offset < end:
+        key, offset = decode_varint(view, offset)
+        field_number = key >> 3
+        wire_type = key & 0x07
+        if field_number == 0:
+            raise ProtobufError(f"Invalid field number at offset {offset}")
+        name = str(field_number)
+        float_field = None
+
+        if wire_type == VARINT:
+            value, offset = decode_varint(view, offset)
+        elif wire_type == FIXED64:
+            if offset + 8 > end:
+                raise ProtobufError("Truncated fixed64 field")
+            value = UINT64_STRUCT.unpack_from(view, offset)[0]
+            float_field = f"{name}_double", _finite(DOUBLE_STRUCT.unpack_from(view, offset)[0])
+            offset += 8
+        elif wire_type == LENGTH_DELIMITED:
+            length, offset = decode_varint(view, offset)
+            if offset + length > end:
+                raise ProtobufError("Length-delimited field runs past the end of the message")
+            value = _decode_length_delimited(view[offset:offset + length], depth)
+            offset += length
+        elif wire_type == FIXED32:
+            if offset + 4 > end:
+                raise ProtobufError("Truncated fixed32 field")
+            value = UINT32_STRUCT.unpack_from(view, offset)[0]
+            float_field = f"{name}_float", _finite(FLOAT_STRUCT.unpack_from(view, offset)[0])
+            offset += 4
+        else:
+            raise ProtobufError(f"Unsupported wire type {wire_type} for field {field_number}")
+
+        _add_field(fields, name, value)
+        if float_field is not None:
+            _add_field(fields, *float_field)
+    return fields
+
+
+def decode_message(data: bytes | memoryview) -> dict[str, typing.Any]:
+    """
+    Decodes a protobuf message without a schema.
+    Keys are field numbers. fixed64/fixed32 fields are unsigned integers, with
+    the same bytes read as a double/float under "<field>_double"/"<field>_float"
+    (None when not finite). Nested messages are decoded recursively from slices
+    of the same buffer.
+    Raises ProtobufError if the data isn't a valid message.
+    """
+    return _decode_message(memoryview(data), 0)
+
+
+# decodes many payloads, the ones that aren't protobuf come back as None
+def decode_messages(payloads: typing.Iterable[bytes | memoryview]) -> list[dict[str, typing.Any] | None]:
+    results = []
+    for payload in payloads:
+        try:
+            results.append(_decode_message(memoryview(payload), 0))
+        except ProtobufError:
+            results.append(None)
+    return results
@@ -1,51 +1,96 @@
 import os
+import sys
+import mmap
 import pathlib
 import struct
 import dataclasses
 import typing
 import datetime
 import zlib
-import pytz 
+import re
+import bisect
 import json
+import math
 from argparse import ArgumentParser
 
+from protobuf_decoder import decode_messages
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "parsing_tools"))
+from binary_reader import BinaryReader, DOUBLE_LE, INT32_LE
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
+
 __description__ = "A Python script to read and parse SEGB files"
 __organozation__ = "Omen-Cyber"
 __contact__ = "DaKota LaFeber"
 
 
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = ArgumentParser(description="A tool that extracts parses data from SEGB files.")
-    parser.add_argument("-f", "--file", dest="input_dir", required=True, help="Path to the SEGB file")
-    parser.add_argument("-o", "--output", dest="output_dir", help="Path to the output directory")
-    return parser.parse_args()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-f", "--file", dest="input_dir", help="Path to the SEGB file")
+    source.add_argument("-d", "--directory", dest="directory", help="Path to a Biome streams directory, every SEGB file below it is parsed")
+    parser.add_argument("-o", "--output", dest="output_dir", help="Path to the output file, or the output directory with -d")
+    parser.add_argument("--mmap", dest="use_mmap", action="store_true", help="Memory-map the file and parse records without copying them")
+    parser.add_argument("-p", "--protobuf", dest="decode_protobuf", action="store_true", help="Decode record data as protobuf messages without a schema")
+    parser.add_argument("--carve", dest="carve", action="store_true", help="Recover records by scanning the whole file, for damaged files or raw dumps")
+    parser.add_argument("--format", dest="output_format", choices=["json", "ndjson"], default="json", help="Output format (default: json)")
+    parser.add_argument("--case-db", dest="case_db", help="Also load the records into this case SQLite database")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, help="Number of worker processes for -d (default: CPU count)")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
 
 # Defining magic bytes 
 HEADER_LENGTH = 32
 ENTRY_HEADER_LENGTH = 8
 TRAILER_ENTRY_LENGTH = 16
 MAGIC = b"SEGB"
-# SEGB files use Cocoa timestamps, using pytz for timezone handling
-APPLE_EPOCH = datetime.datetime(2001, 1, 1, tzinfo=pytz.UTC)
-
-
-# storing metadata (offsets, state, and creation time)
-@dataclasses.dataclass(frozen=True)
+# precompiled layouts of the file header, record header and trailer entries
+HEADER_STRUCT = struct.Struct("<4sid16s")
+ENTRY_HEADER_STRUCT = struct.Struct("<Ii")
+TRAILER_ENTRY_STRUCT = struct.Struct("<2id")
+# SEGB v1 files have a 56 byte header with the magic at the end of it,
+# records follow each other with a 32 byte header and are 8 byte aligned
+V1_HEADER_LENGTH = 56
+V1_MAGIC_OFFSET = 52
+V1_RECORD_HEADER_LENGTH = 32
+V1_RECORD_HEADER_STRUCT = struct.Struct("<2i2d2I")
+V1_DELETED_STATE = 3
+# carving only accepts timestamps between these Cocoa times (2004 to 2064)
+CARVE_MIN_TIMESTAMP = 1e8
+CARVE_MAX_TIMESTAMP = 2e9
+# the top two bytes of a little-endian double in that range, found with one regex scan
+CARVE_TIMESTAMP_PATTERN = re.compile(rb"[\x97-\xdd]\x41")
+# v2 chains try at most this many possible record starts per end offset
+CARVE_MAX_PENDING_STARTS = 64
+# number of records whose payloads are protobuf-decoded together
+PROTOBUF_BATCH_SIZE = 1000
+# SEGB files use Cocoa timestamps, seconds since 2001-01-01 UTC
+APPLE_EPOCH = datetime.datetime(2001, 1, 1, tzinfo=datetime.timezone.utc)
+APPLE_EPOCH_UNIX = APPLE_EPOCH.timestamp()
+
+
+# storing metadata (offsets, state, and the raw Cocoa creation time)
+@dataclasses.dataclass(frozen=True, slots=True)
 class EntryMetadata:
     metadata_offset: int
     end_offset: int
     state: int
-    creation: datetime.datetime
+    creation_raw: float
+
+    # the creation time is only converted to a datetime when asked for
+    @property
+    def creation(self) -> datetime.datetime:
+        return decode_cocoa_time(self.creation_raw)
 
 
 # SEGB entry values
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, slots=True)
 class SegbEntry:
     metadata: EntryMetadata
     data_start_offset: int
     metadata_crc: int
     actual_crc: int
-    data: bytes
+    data: bytes | memoryview
     _unknown_value: int = dataclasses.field(kw_only=True, compare=False)
 
     # getting the creation timestamp
@@ -64,13 +109,27 @@ class SegbEntry:
         return self.metadata.state
 
 
-# checks magic bytes in a stream
+# works out the SEGB version from the start of a file, None if it isn't SEGB
+def detect_segb_version(file_header: bytes | memoryview) -> int | None:
+    if len(file_header) >= V1_HEADER_LENGTH and file_header[V1_MAGIC_OFFSET:V1_MAGIC_OFFSET + 4] == MAGIC:
+        return 1
+    if len(file_header) >= HEADER_LENGTH and file_header[0:4] == MAGIC:
+        return 2
+    return None
+
+
+# checks magic bytes in a stream, both SEGB versions are accepted
 def stream_matches_segb_signature(stream: typing.BinaryIO) -> bool:
+    return stream_segb_version(stream) is not None
+
+
+# reads the version from a stream without moving it
+def stream_segb_version(stream: typing.BinaryIO) -> int | None:
     reset_offset = stream.tell()
-    file_header = stream.read(HEADER_LENGTH)
+    file_header = stream.read(V1_HEADER_LENGTH)
     stream.seek(reset_offset, os.SEEK_SET)
 
-    return len(file_header) == HEADER_LENGTH and file_header[0:4] == MAGIC
+    return detect_segb_version(file_header)
 
 
 # checks if file matches SEGB signature by calling stream_matches_segb_signature 
@@ -91,12 +150,10 @@ def read_segb_stream(stream: typing.BinaryIO) -> typing.Iterable[SegbEntry]:
 
     # reads header to get magic bytes, entries count, and creation timestamp
     header_raw = stream.read(HEADER_LENGTH) 
-    magic_number, entries_count, creation_timestamp_raw, unknown_padding = struct.unpack("<4sid16s", header_raw)
+    magic_number, entries_count, creation_timestamp_raw, unknown_padding = HEADER_STRUCT.unpack(header_raw)
     if magic_number != MAGIC:
         raise ValueError(f"Unexpected file magic. Expected: {MAGIC.hex()}; got: {magic_number.hex()}")
 
-    creation_date = decode_cocoa_time(creation_timestamp_raw)
-
     # reads trailer entries in reverse
     trailer_reverse_offset = TRAILER_ENTRY_LENGTH * entries_count
     stream.seek(-trailer_reverse_offset, os.SEEK_END)
@@ -105,75 +162,505 @@ def read_segb_stream(stream: typing.BinaryIO) -> typing.Iterable[SegbEntry]:
     for _ in range(entries_count):
         meta_offset = stream.tell()
         trailer_entry_raw = stream.read(TRAILER_ENTRY_LENGTH)
-        entry_end_offset, entry_state_raw, entry_timestamp_raw = struct.unpack("<2id", trailer_entry_raw)
-        entry_creation_date = decode_cocoa_time(entry_timestamp_raw)
+        entry_end_offset, entry_state_raw, entry_timestamp_raw = TRAILER_ENTRY_STRUCT.unpack(trailer_entry_raw)
         trailer_list.append(
             EntryMetadata(
-                meta_offset, entry_end_offset, entry_state_raw, entry_creation_date))
+                meta_offset, entry_end_offset, entry_state_raw, entry_timestamp_raw))
 
     stream.seek(HEADER_LENGTH, os.SEEK_SET)
 
     trailer_list.sort(key=lambda x: x.end_offset)
     for trailer_entry in trailer_list:
         entry_offset = stream.tell()
+        entry_length = trailer_entry.end_offset - entry_offset + HEADER_LENGTH
 
+        # deleted entries still take up space, so they are skipped over rather than read
         if trailer_entry.state == 4:
-            continue
-
-        # calculates the CRC
-        entry_length = trailer_entry.end_offset - stream.tell() + HEADER_LENGTH
-        entry_raw = stream.read(entry_length)
-        data = entry_raw[ENTRY_HEADER_LENGTH:]
-        crc32_stored, unknown_raw = struct.unpack("Ii", entry_raw[:ENTRY_HEADER_LENGTH])
-        crc32_calculated = zlib.crc32(data)
+            stream.seek(entry_length, os.SEEK_CUR)
+            entry = None
+        else:
+            # calculates the CRC
+            entry_raw = stream.read(entry_length)
+            data = entry_raw[ENTRY_HEADER_LENGTH:]
+            crc32_stored, unknown_raw = ENTRY_HEADER_STRUCT.unpack(entry_raw[:ENTRY_HEADER_LENGTH])
+            crc32_calculated = zlib.crc32(data)
+            entry = SegbEntry(trailer_entry, entry_offset, crc32_stored, crc32_calculated, data, _unknown_value=unknown_raw)
 
         if (remainder := trailer_entry.end_offset % 4) != 0:
             stream.seek(4 - remainder, os.SEEK_CUR)
 
-        yield SegbEntry(trailer_entry, entry_offset, crc32_stored, crc32_calculated, data, _unknown_value=unknown_raw)
+        if entry is not None:
+            yield entry
+
+
+# reads SEGB v1 streams, records are found by walking the data region up to the end offset in the header
+def read_segb_v1_stream(stream: typing.BinaryIO) -> typing.Iterable[SegbEntry]:
+    header_raw = stream.read(V1_HEADER_LENGTH)
+    if len(header_raw) != V1_HEADER_LENGTH or header_raw[V1_MAGIC_OFFSET:] != MAGIC:
+        raise ValueError(f"Unexpected file magic. Expected: {MAGIC.hex()}; got: {header_raw[V1_MAGIC_OFFSET:].hex()}")
+    end_of_data_offset, = INT32_LE.unpack(header_raw[0:4])
+
+    while stream.tell() + V1_RECORD_HEADER_LENGTH <= end_of_data_offset:
+        entry_offset = stream.tell()
+        record_length, state, timestamp1_raw, timestamp2_raw, crc32_stored, unknown_raw = \
+            V1_RECORD_HEADER_STRUCT.unpack(stream.read(V1_RECORD_HEADER_LENGTH))
+        if record_length <= 0:
+            break
+
+        data = stream.read(record_length)
+        end_offset = stream.tell()
+        if (remainder := end_offset % 8) != 0:
+            stream.seek(8 - remainder, os.SEEK_CUR)
+
+        if state == V1_DELETED_STATE:
+            continue
+
+        yield SegbEntry(EntryMetadata(entry_offset, end_offset, state, timestamp1_raw), entry_offset,
+                        crc32_stored, zlib.crc32(data), data, _unknown_value=unknown_raw)
+
+
+# reads either SEGB version from a stream
+def read_any_segb_stream(stream: typing.BinaryIO) -> typing.Iterable[SegbEntry]:
+    if stream_segb_version(stream) == 1:
+        return read_segb_v1_stream(stream)
+    return read_segb_stream(stream)
+
+
+# SEGB v1 version of read_segb_buffer
+def read_segb_v1_buffer(reader: BinaryReader) -> typing.Iterable[SegbEntry]:
+    end_of_data_offset = min(reader.unpack_from(INT32_LE, 0)[0], len(reader))
+
+    entry_offset = V1_HEADER_LENGTH
+    while entry_offset + V1_RECORD_HEADER_LENGTH <= end_of_data_offset:
+        record_length, state, timestamp1_raw, timestamp2_raw, crc32_stored, unknown_raw = \
+            reader.unpack_from(V1_RECORD_HEADER_STRUCT, entry_offset)
+        if record_length <= 0:
+            break
+
+        data_offset = entry_offset + V1_RECORD_HEADER_LENGTH
+        end_offset = data_offset + record_length
+        if state != V1_DELETED_STATE:
+            data = reader.slice(data_offset, record_length)
+            yield SegbEntry(EntryMetadata(entry_offset, end_offset, state, timestamp1_raw), entry_offset,
+                            crc32_stored, zlib.crc32(data), data, _unknown_value=unknown_raw)
+
+        entry_offset = end_offset + (-end_offset % 8)
+
+
+# parses a SEGB file that is already in memory, records are memoryview slices of the buffer
+def read_segb_buffer(buffer: bytes | bytearray | memoryview | mmap.mmap) -> typing.Iterable[SegbEntry]:
+    reader = BinaryReader(buffer)
+    if len(reader) < HEADER_LENGTH:
+        raise ValueError(f"File too short for a SEGB header: {len(reader)} bytes")
+    if detect_segb_version(reader.view[:V1_HEADER_LENGTH]) == 1:
+        yield from read_segb_v1_buffer(reader)
+        return
+
+    magic_number, entries_count, creation_timestamp_raw, unknown_padding = reader.unpack_from(HEADER_STRUCT, 0)
+    if magic_number != MAGIC:
+        raise ValueError(f"Unexpected file magic. Expected: {MAGIC.hex()}; got: {magic_number.hex()}")
+
+    # the whole trailer table is unpacked in one call, kept as plain tuples
+    # of (end offset, state, raw timestamp, trailer offset)
+    trailer_offset = len(reader) - TRAILER_ENTRY_LENGTH * entries_count
+    if entries_count < 0 or trailer_offset < HEADER_LENGTH:
+        raise ValueError(f"Entries count {entries_count} does not fit in the file")
+    trailer_list = [
+        (end_offset, state, timestamp, trailer_offset + index * TRAILER_ENTRY_LENGTH)
+        for index, (end_offset, state, timestamp) in enumerate(
+            reader.iter_unpack(TRAILER_ENTRY_STRUCT, trailer_offset, entries_count))]
+    trailer_list.sort()
+
+    # record offsets come from the previous entry's end, deleted entries still take up space
+    entry_offset = HEADER_LENGTH
+    for end_offset, state, timestamp, meta_offset in trailer_list:
+        entry_end = end_offset + HEADER_LENGTH
+        if entry_end > trailer_offset or entry_end < entry_offset + ENTRY_HEADER_LENGTH:
+            raise ValueError(f"Entry at offset {entry_offset} has a bad end offset: {end_offset}")
+
+        # deleted entries are skipped before any metadata is built for them
+        if state != 4:
+            crc32_stored, unknown_raw = reader.unpack_from(ENTRY_HEADER_STRUCT, entry_offset)
+            data = reader.slice(entry_offset + ENTRY_HEADER_LENGTH, entry_end - entry_offset - ENTRY_HEADER_LENGTH)
+            yield SegbEntry(EntryMetadata(meta_offset, end_offset, state, timestamp), entry_offset,
+                            crc32_stored, zlib.crc32(data), data, _unknown_value=unknown_raw)
+
+        entry_offset = entry_end + (-entry_end % 4)
+
+
+def _carve_v1_record(reader: BinaryReader, record_offset: int) -> SegbEntry | None:
+    if record_offset < 0 or record_offset + V1_RECORD_HEADER_LENGTH > len(reader):
+        return None
+    record_length, state, timestamp1_raw, timestamp2_raw, crc32_stored, unknown_raw = \
+        reader.unpack_from(V1_RECORD_HEADER_STRUCT, record_offset)
+    data_offset = record_offset + V1_RECORD_HEADER_LENGTH
+    end_offset = data_offset + record_length
+    if record_length <= 0 or end_offset > len(reader) or not 1 <= state <= 4:
+        return None
+    data = reader.slice(data_offset, record_length)
+    if zlib.crc32(data) != crc32_stored:
+        return None
+    return SegbEntry(EntryMetadata(record_offset, end_offset, state, timestamp1_raw), record_offset,
+                     crc32_stored, crc32_stored, data, _unknown_value=unknown_raw)
+
+
+def _carve_v2_records(reader: BinaryReader, base: int, region_end: int, trailer_offsets: list[int]) -> list[SegbEntry]:
+    """
+    Rebuilds v2 records for the file starting at base from whatever trailer
+    entries were found. Entry ends are walked in order and each record may
+    start after any end seen since the last good record, so trailer-like
+    bytes inside record data don't break the chain.
+    """
+    ends = {}
+    for trailer_offset in trailer_offsets:
+        end_offset, state, timestamp = reader.unpack_from(TRAILER_ENTRY_STRUCT, trailer_offset)
+        entry_end = base + HEADER_LENGTH + end_offset
+        if 1 <= state <= 4 and end_offset > ENTRY_HEADER_LENGTH and entry_end <= min(trailer_offset, region_end):
+            ends.setdefault(entry_end, (end_offset, state, timestamp, trailer_offset))
+
+    records = []
+    pending_starts = [base + HEADER_LENGTH]
+    for entry_end in sorted(ends):
+        end_offset, state, timestamp, trailer_offset = ends[entry_end]
+        for entry_offset in pending_starts:
+            if entry_end - entry_offset <= ENTRY_HEADER_LENGTH:
+                continue
+            crc32_stored, unknown_raw = reader.unpack_from(ENTRY_HEADER_STRUCT, entry_offset)
+            data = reader.slice(entry_offset + ENTRY_HEADER_LENGTH, entry_end - entry_offset - ENTRY_HEADER_LENGTH)
+            if zlib.crc32(data) == crc32_stored:
+                records.append(SegbEntry(EntryMetadata(trailer_offset, end_offset, state, timestamp), entry_offset,
+                                         crc32_stored, crc32_stored, data, _unknown_value=unknown_raw))
+                pending_starts = []
+                break
+        pending_starts.append(entry_end + (-(entry_end - base) % 4))
+        del pending_starts[:-CARVE_MAX_PENDING_STARTS]
+    return records
+
+
+def carve_segb_buffer(buffer: bytes | bytearray | memoryview | mmap.mmap) -> typing.Iterable[SegbEntry]:
+    """
+    Recovers records without trusting the header or trailer, so damaged
+    files, deleted (state 4) entries and orphaned records in raw dumps are
+    found too. Candidates are located with a single regex scan for plausible
+    Cocoa timestamps, which appear in both v1 record headers and v2 trailer
+    entries, and every candidate has to pass its CRC32 check.
+    Records are returned in file order.
+    """
+    reader = BinaryReader(buffer)
+    # every v2 magic starts a file whose offsets are relative to it
+    bases = sorted({0} | {match.start() for match in re.finditer(MAGIC, reader.view)})
+
+    timestamp_offsets = [match.start() - 6 for match in CARVE_TIMESTAMP_PATTERN.finditer(reader.view)]
+    records = {}
+    trailer_offsets_by_base: dict[int, list[int]] = {}
+    for timestamp_offset in timestamp_offsets:
+        # both layouts keep the timestamp 8 bytes into the structure
+        candidate_offset = timestamp_offset - 8
+        if candidate_offset < 0:
+            continue
+        timestamp, = reader.unpack_from(DOUBLE_LE, timestamp_offset)
+        if not CARVE_MIN_TIMESTAMP <= timestamp <= CARVE_MAX_TIMESTAMP:
+            continue
+
+        if (record := _carve_v1_record(reader, candidate_offset)) is not None:
+            records.setdefault(record.data_start_offset, record)
+
+        if candidate_offset + TRAILER_ENTRY_LENGTH <= len(reader):
+            base = bases[bisect.bisect_right(bases, candidate_offset) - 1]
+            if (candidate_offset - base) % 4 == 0:
+                trailer_offsets_by_base.setdefault(base, []).append(candidate_offset)
+
+    for index, base in enumerate(bases):
+        region_end = bases[index + 1] if index + 1 < len(bases) else len(reader)
+        for record in _carve_v2_records(reader, base, region_end, trailer_offsets_by_base.get(base, [])):
+            records.setdefault(record.data_start_offset, record)
+
+    for offset in sorted(records):
+        yield records[offset]
+
+
+# memory-maps a file and parses it with read_segb_buffer, or another buffer parser
+def read_segb_mmap(path: pathlib.Path | os.PathLike | str,
+                   parse_buffer: typing.Callable[[mmap.mmap], typing.Iterable[SegbEntry]] = None) -> typing.Iterable[SegbEntry]:
+    path = pathlib.Path(path)
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"File is empty: {path}")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield from (parse_buffer or read_segb_buffer)(mapped)
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            # records still reference the mapping, it is released once they are gone
+            pass
 
 
 # opens file and reads contents
-def read_segb_file(path: pathlib.Path | os.PathLike | str) -> typing.Iterable[SegbEntry]:
+def read_segb_file(path: pathlib.Path | os.PathLike | str, use_mmap: bool = False, carve: bool = False) -> typing.Iterable[SegbEntry]:
+    if carve:
+        yield from read_segb_mmap(path, carve_segb_buffer)
+        return
+    if use_mmap:
+        yield from read_segb_mmap(path)
+        return
     path = pathlib.Path(path)
     with path.open("rb") as f:
-        yield from read_segb_stream(f)
+        yield from read_any_segb_stream(f)
+
 
-def run_command(file_path: pathlib.Path | os.PathLike | str, output_dir):
+# the creation time as written to the output, a raw timestamp out of datetime's range
+# is kept as the raw Cocoa time (None if it isn't finite) instead of failing the file
+def format_creation_time(metadata: EntryMetadata) -> str | float | None:
     try:
-        records = []
-        for record in read_segb_file(file_path):
+        return metadata.creation.strftime('%Y-%m-%d %H:%M:%S %Z')
+    except (OverflowError, ValueError):
+        return metadata.creation_raw if math.isfinite(metadata.creation_raw) else None
+
+
+def creation_epoch(creation_raw: float) -> float | None:
+    return creation_raw + APPLE_EPOCH_UNIX if math.isfinite(creation_raw) else None
+
+
+# converts a record into the dictionary written to the JSON output
+def record_to_dict(record: SegbEntry, protobuf: dict | None = None) -> dict:
+    decoded_data = str(record.data, 'utf-8', errors='replace')
+    clean_data = ''.join(char for char in decoded_data if char.isprintable()) # removing extra bytes
+    entry = {
+        "Offset": record.data_start_offset,
+        "Creation Timestamp": format_creation_time(record.metadata),
+        # Unix seconds (UTC), so the timeline doesn't have to parse the local time above
+        "Creation Epoch": creation_epoch(record.metadata.creation_raw),
+        "State": record.metadata.state,
+        "CRC Passed": record.crc_passed,
+        "Data": clean_data
+    }
+    if protobuf is not None:
+        entry["Protobuf"] = protobuf
+    return entry
+
+
+# parses one file into (raw creation time, output dictionary) pairs as they are read, records failing the CRC are left out
+# "read" covers I/O, header parsing and the CRC check, "convert" building the output dictionaries
+def iter_segb_entries(file_path: pathlib.Path | os.PathLike | str, use_mmap=False, decode_protobuf=False,
+                      batch_size=PROTOBUF_BATCH_SIZE, carve=False, metrics=NO_METRICS) -> typing.Iterator[tuple[float, dict]]:
+    metrics.count("read", files=1, bytes=os.path.getsize(file_path) if metrics else 0)
+    return _iter_entries(read_segb_file(file_path, use_mmap, carve), file_path, decode_protobuf, batch_size, metrics)
+
+
+# iter_segb_entries for a file that is already in memory, e.g. an archive member
+def iter_segb_buffer_entries(buffer: bytes | bytearray | memoryview | mmap.mmap, name: str, decode_protobuf=False,
+                             batch_size=PROTOBUF_BATCH_SIZE, carve=False, metrics=NO_METRICS) -> typing.Iterator[tuple[float, dict]]:
+    metrics.count("read", files=1, bytes=len(buffer))
+    records = carve_segb_buffer(buffer) if carve else read_segb_buffer(buffer)
+    return _iter_entries(records, name, decode_protobuf, batch_size, metrics)
+
+
+def _iter_entries(records: typing.Iterable[SegbEntry], name, decode_protobuf: bool, batch_size: int,
+                  metrics) -> typing.Iterator[tuple[float, dict]]:
+    batch = []
+    try:
+        for record in metrics.timed_iter("read", records):
             if record.crc_passed == True: # when false, returns null values for Data
-                decoded_data = record.data.decode('utf-8', errors='replace')
-                clean_data = ''.join(char for char in decoded_data if char.isprintable()) # removing extra bytes
-                entry = {
-                    "Offset": record.data_start_offset,
-                    "Creation Timestamp": record.metadata.creation.strftime('%Y-%m-%d %H:%M:%S %Z'),
-                    "State": record.metadata.state,
-                    "CRC Passed": record.crc_passed,
-                    "Data": clean_data 
-                }
-                records.append(entry)
+                if not decode_protobuf:
+                    with metrics.stage("convert"):
+                        entry = record_to_dict(record)
+                    yield record.metadata.creation_raw, entry
+                    continue
+                # payloads are decoded a batch at a time
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    # the batch is emptied first, so a failure while it is decoded can't return it twice
+                    full_batch, batch = batch, []
+                    yield from _decode_batch(full_batch, metrics)
+            else:
+                metrics.count("read", crc_failed=1)
     except Exception as e:
-        print(f"An error occurred: {e}")
-
-    # Save records to JSON file
-    output_file = pathlib.Path(file_path).stem + "_output.json"
+        print(f"An error occurred in {name}: {e}")
+    # whatever was read before an error is still returned
+    yield from _decode_batch(batch, metrics)
+
+
+def _decode_batch(batch: list[SegbEntry], metrics=NO_METRICS) -> typing.Iterator[tuple[float, dict]]:
+    with metrics.stage("protobuf"):
+        protobufs = decode_messages(record.data for record in batch)
+    metrics.count("protobuf", records=len(batch))
+    for record, protobuf in zip(batch, protobufs):
+        with metrics.stage("convert"):
+            entry = record_to_dict(record, protobuf)
+        yield record.metadata.creation_raw, entry
+
+
+# the row loaded into the case database for one record
+def segb_case_row(creation_raw: float, entry: dict, file_name: str, stream_name: str) -> dict:
+    return {
+        "timestamp": creation_raw + APPLE_EPOCH_UNIX,
+        "stream": stream_name,
+        "file": file_name,
+        "offset": entry["Offset"],
+        "state": entry["State"],
+        "data": entry["Data"],
+        "source": file_name,
+        "record": entry
+    }
+
+
+class RecordWriter:
+    """
+    Writes records to a file one at a time, either as a JSON array
+    laid out like json.dump(indent=4) or as NDJSON (one record per line).
+    Closing the writer always leaves a complete document behind,
+    so records written before a failure are kept.
+    """
+
+    def __init__(self, output_file: pathlib.Path | os.PathLike | str, output_format: str = "json"):
+        self.output_file = output_file
+        self.output_format = output_format
+        self.count = 0
+        self._file = open(output_file, 'w')
+        if output_format == "json":
+            self._file.write("[")
+
+    def write(self, record: dict):
+        if self.output_format == "ndjson":
+            self._file.write(json.dumps(record))
+            self._file.write("\n")
+        else:
+            self._file.write(",\n    " if self.count else "\n    ")
+            self._file.write(json.dumps(record, indent=4).replace("\n", "\n    "))
+        self.count += 1
+
+    def close(self):
+        if self.output_format == "json":
+            self._file.write("\n]" if self.count else "]")
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# sqlite3 is only imported when a case database was asked for
+def open_case_store(case_db):
+    if not case_db:
+        return None
+    from case_store import CaseStore
+    return CaseStore(case_db)
+
+
+def output_suffix(output_format: str) -> str:
+    return ".ndjson" if output_format == "ndjson" else ".json"
+
+
+def run_command(file_path: pathlib.Path | os.PathLike | str, output_dir, use_mmap=False, decode_protobuf=False,
+                output_format="json", carve=False, case_db=None, metrics=NO_METRICS):
+    # Stream records into the output file as they are parsed
+    output_file = pathlib.Path(file_path).stem + "_output" + output_suffix(output_format)
     if output_dir:
         output_file = output_dir
-    with open(output_file, 'w') as f:
-        json.dump(records, f, indent=4)
+    case_store = open_case_store(case_db)
+    try:
+        with RecordWriter(output_file, output_format) as writer:
+            for creation_raw, entry in iter_segb_entries(file_path, use_mmap, decode_protobuf, carve=carve, metrics=metrics):
+                with metrics.stage("write"):
+                    writer.write(entry)
+                if case_store:
+                    with metrics.stage("case_db"):
+                        case_store.add("segb", segb_case_row(creation_raw, entry, str(file_path), pathlib.Path(file_path).parent.name))
+            metrics.count("write", records=writer.count)
+    finally:
+        if case_store:
+            with metrics.stage("case_db"):
+                case_store.close()
+            print(f"Records loaded into {case_db}")
     print(f"Output saved to {output_file}")
 
 
-if __name__ == '__main__':
-    import sys
-
-    if len(sys.argv) < 2:
-        print(f"USAGE: {pathlib.Path(sys.argv[0]).name} <SEGB file>")
+# worker for run_directory, returns None for files that aren't SEGB
+def _parse_directory_file(path: pathlib.Path, use_mmap: bool, decode_protobuf: bool, carve: bool) -> list[tuple[float, dict]] | None:
+    try:
+        if not file_matches_segb_signature(path):
+            return None
+    except OSError:
+        return None
+    return list(iter_segb_entries(path, use_mmap, decode_protobuf, carve=carve))
+
+
+# names a stream after the folders between the root and the file, e.g. restricted_App.InFocus_local
+def stream_output_name(root: pathlib.Path, path: pathlib.Path) -> str:
+    relative_parent = path.parent.relative_to(root)
+    return "_".join(relative_parent.parts) or root.name
+
+
+def run_directory(directory: pathlib.Path | os.PathLike | str, output_dir, use_mmap=False, workers=None, decode_protobuf=False,
+                  output_format="json", carve=False, case_db=None, metrics=NO_METRICS):
+    """
+    Parses every SEGB file below a directory (normally Biome/streams)
+    in a process pool and writes one output file per stream folder.
+    Each record gets a "File" key naming the SEGB file it came from.
+    The "parse" stage is the time spent waiting on the workers.
+    """
+    root = pathlib.Path(directory)
+    output_dir = pathlib.Path(output_dir) if output_dir else pathlib.Path.cwd()
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with metrics.stage("scan"):
+        paths = sorted(path for path in root.rglob("*") if path.is_file())
+    metrics.count("scan", files=len(paths))
+    # each file's records are written out as soon as its worker finishes
+    writers: dict[str, RecordWriter] = {}
+    case_store = open_case_store(case_db)
+    # the process pool is the slowest import of this tool, only -d needs it
+    from concurrent.futures import ProcessPoolExecutor
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_parse_directory_file, paths, [use_mmap] * len(paths),
+                                   [decode_protobuf] * len(paths), [carve] * len(paths), chunksize=16)
+            for path, records in zip(paths, metrics.timed_iter("parse", results, counter="files")):
+                if records is None:
+                    continue
+                stream_name = stream_output_name(root, path)
+                if stream_name not in writers:
+                    output_file = output_dir / f"{stream_name}_output{output_suffix(output_format)}"
+                    writers[stream_name] = RecordWriter(output_file, output_format)
+                file_name = str(path.relative_to(root))
+                with metrics.stage("write"):
+                    for creation_raw, entry in records:
+                        entry["File"] = file_name
+                        writers[stream_name].write(entry)
+                metrics.count("write", records=len(records))
+                if case_store:
+                    with metrics.stage("case_db"):
+                        for creation_raw, entry in records:
+                            case_store.add("segb", segb_case_row(creation_raw, entry, file_name, stream_name))
+    finally:
+        for stream_name, writer in writers.items():
+            writer.close()
+            print(f"Output for stream '{stream_name}' saved to {writer.output_file}")
+        if case_store:
+            with metrics.stage("case_db"):
+                case_store.close()
+            print(f"Records loaded into {case_db}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(f"USAGE: {pathlib.Path(sys.argv[0]).name} -f <SEGB file> | -d <Biome streams directory>")
         print()
         exit(1)
 
-    args = parse_arguments()
-    run_command(args.input_dir, args.output_dir)
+    args = parse_arguments(argv)
+    with Metrics.from_args("segb_parser", args) as metrics:
+        if args.directory:
+            run_directory(args.directory, args.output_dir, args.use_mmap, args.workers, args.decode_protobuf, args.output_format, args.carve, args.case_db, metrics)
+        else:
+            run_command(args.input_dir, args.output_dir, args.use_mmap, args.decode_protobuf, args.output_format, args.carve, args.case_db, metrics)
     print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import heapq
+import pathlib
+import tempfile
+import datetime
+import functools
+import zoneinfo
+from argparse import ArgumentParser, ArgumentTypeError
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent / "parsing_tools"))
+from metrics import Metrics, NO_METRICS, add_metrics_arguments
+from cocoa_time import COCOA_EPOCH_OFFSET
+
+__description__ = "Merges the output of the iMessage, knowledgeC, SEGB and cookie parsers into one time-sorted timeline"
+__organization__ = "Omen-Cyber"
+__contact__ = "DaKota LaFeber"
+
+# Events are sorted in memory this many at a time, full chunks are spilled to disk as sorted runs
+CHUNK_SIZE = 500000
+READ_SIZE = 1 << 20
+
+
+def parse_arguments(argv=None):
+    parser = ArgumentParser(description="A tool to build one time-sorted timeline from the outputs of the other tools")
+    parser.add_argument("--imessage", action="append", default=[], help="iMessageQuery output file")
+    parser.add_argument("--knowledgec", action="append", default=[], help="knowledgeC output file, one per stream")
+    parser.add_argument("--segb", action="append", default=[], help="segb_parser output file")
+    parser.add_argument("--cookies", action="append", default=[], help="bcf_parser output file (json or ndjson)")
+    parser.add_argument("-o", "--output", dest="output_file", required=True, help="Path to the NDJSON timeline")
+    parser.add_argument("--source-timezone", dest="source_timezone", type=parse_timezone_argument,
+                        help="Time zone the tools ran in, e.g. America/New_York, for outputs that only have local times "
+                             "(default: this machine's)")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=CHUNK_SIZE,
+                        help=f"Events sorted in memory before spilling to disk (default: {CHUNK_SIZE})")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def parse_timezone_argument(value):
+    try:
+        return zoneinfo.ZoneInfo(value)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ArgumentTypeError(f"unknown time zone: {value}")
+
+
+def iter_json_records(path):
+    """
+    Yields the records of a JSON array or NDJSON file one at a time,
+    so large outputs are never loaded whole.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buffer = f.read(READ_SIZE)
+        position = len(buffer) - len(buffer.lstrip())
+        if not buffer[position:position + 1] == "[":
+            # NDJSON, one record per line
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        position += 1
+        while True:
+            # skip whitespace and the commas between records
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    raise
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield record
+
+
+def record_epoch(record, epoch_key, time_key, source_zone=None):
+    """
+    The Unix time of a record: the epoch the tool wrote next to its display time,
+    or for outputs written before the tools kept one, the display time itself.
+    """
+    epoch = record.get(epoch_key)
+    if isinstance(epoch, (int, float)):
+        return epoch
+    return local_time_to_epoch(record.get(time_key), source_zone)
+
+
+# Display times without a zone are in the local time of the machine that ran the tool,
+# source_zone names it when that wasn't this machine
+def local_time_to_epoch(value, source_zone=None):
+    if not isinstance(value, str):
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(value[:19])
+    except ValueError:
+        return None
+    # segb_parser appends the zone abbreviation, only UTC is unambiguous
+    if value[19:].strip() in ("UTC", "GMT"):
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    elif source_zone is not None:
+        moment = moment.replace(tzinfo=source_zone)
+    return moment.timestamp()
+
+
+def iso_or_cocoa_to_epoch(value):
+    if isinstance(value, (int, float)):
+        return value + COCOA_EPOCH_OFFSET
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        # bcf_parser used to write day precision dates such as "Sun, 13 Nov 2022"
+        try:
+            return datetime.datetime.strptime(value, "%a, %d %b %Y").replace(tzinfo=datetime.timezone.utc).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+
+def imessage_events(path, source_zone=None):
+    for record in iter_json_records(path):
+        yield record_epoch(record, "Epoch", "Date", source_zone), "imessage", \
+            f"{record.get('From')} -> {record.get('To')}: {record.get('Message') or ''}", record
+
+
+def knowledgec_events(path, source_zone=None):
+    for record in iter_json_records(path):
+        yield record_epoch(record, "START EPOCH", "START", source_zone), "knowledgec", \
+            f"{record.get('ZSTREAMNAME')} {record.get('ZBUNDLEID') or record.get('ZVALUESTRING') or ''}".strip(), record
+
+
+def segb_events(path, source_zone=None):
+    for record in iter_json_records(path):
+        yield record_epoch(record, "Creation Epoch", "Creation Timestamp", source_zone), "segb", \
+            f"{record.get('File') or os.path.basename(path)} @ {record.get('Offset')}", record
+
+
+def cookie_events(path):
+    for record in iter_json_records(path):
+        # json output is grouped by page, ndjson has one cookie per line
+        cookies = record["Cookie Data"] if "Cookie Data" in record else [record]
+        for cookie in cookies:
+            yield iso_or_cocoa_to_epoch(cookie.get("created")), "cookies", \
+                f"Cookie created {cookie.get('domain')} {cookie.get('name')}", cookie
+
+
+def to_event(epoch, source, description, record):
+    return {
+        "epoch": epoch,
+        "timestamp": datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat(),
+        "source": source,
+        "description": description,
+        "record": record
+    }
+
+
+def _write_run(events, directory):
+    run = tempfile.NamedTemporaryFile("w", dir=directory, suffix=".ndjson", delete=False)
+    with run:
+        for event in events:
+            run.write(json.dumps(event))
+            run.write("\n")
+    return run.name
+
+
+def _read_run(path):
+    with open(path, "r") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def build_timeline(sources, output_file, chunk_size=CHUNK_SIZE, metrics=NO_METRICS):
+    """
+    Builds a time-sorted NDJSON timeline from (event generator, path) pairs.
+    Events are sorted chunk by chunk, chunks that fill up are spilled to
+    temporary files, and all sorted runs are combined with a k-way heap merge,
+    so memory stays around one chunk however many events there are.
+    Returns the number of events written and the number skipped for lacking a usable time.
+    """
+    skipped = 0
+    written = 0
+    with tempfile.TemporaryDirectory(prefix="timeline_") as spill_directory:
+        run_paths = []
+        chunk = []
+        for read_events, path in sources:
+            # "read" covers parsing the tool outputs
+            for epoch, source, description, record in metrics.timed_iter("read", read_events(path), counter="events"):
+                if epoch is None:
+                    skipped += 1
+                    continue
+                try:
+                    event = to_event(epoch, source, description, record)
+                except (OverflowError, ValueError, OSError):
+                    # damaged times (e.g. 1e300, NaN) are kept by the parsers but can't be placed
+                    skipped += 1
+                    continue
+                chunk.append(event)
+                if len(chunk) >= chunk_size:
+                    with metrics.stage("sort"):
+                        chunk.sort(key=lambda event: event["epoch"])
+                    with metrics.stage("spill"):
+                        run_paths.append(_write_run(chunk, spill_directory))
+                    metrics.count("spill", events=len(chunk))
+                    chunk = []
+        with metrics.stage("sort"):
+            chunk.sort(key=lambda event: event["epoch"])
+
+        runs = [_read_run(run_path) for run_path in run_paths] + [iter(chunk)]
+        # "merge" includes reading the spilled runs back and writing the timeline
+        with metrics.stage("merge"), open(output_file, "w", buffering=READ_SIZE) as out:
+            for event in heapq.merge(*runs, key=lambda event: event["epoch"]):
+                out.write(json.dumps(event))
+                out.write("\n")
+                written += 1
+        metrics.count("merge", events=written, runs=len(runs))
+    return written, skipped
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    # cookie times always carry their zone, only the other tools' local times need it
+    imessage = functools.partial(imessage_events, source_zone=args.source_timezone)
+    knowledgec = functools.partial(knowledgec_events, source_zone=args.source_timezone)
+    segb = functools.partial(segb_events, source_zone=args.source_timezone)
+    sources = (
+        [(imessage, path) for path in args.imessage] +
+        [(knowledgec, path) for path in args.knowledgec] +
+        [(segb, path) for path in args.segb] +
+        [(cookie_events, path) for path in args.cookies]
+    )
+    with Metrics.from_args("timeline", args) as metrics:
+        written, skipped = build_timeline(sources, args.output_file, args.chunk_size, metrics)
+        print(f"Timeline with {written} events saved to {args.output_file}")
+        if skipped:
+            print(f"Skipped {skipped} records without a usable timestamp")
+
+
+if __name__ == "__main__":
+    main()